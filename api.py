@@ -1,53 +1,74 @@
 import time
 
-from flask import Flask, jsonify, request
-import aiomysql
+from flask import Flask, Response, jsonify, request, stream_with_context
 from datetime import datetime, timedelta
 from flask_cors import CORS
-import aiohttp
 import asyncio
-from flask_caching import Cache
 import json
 import threading
-from database_updater import main as start_all_trackers
-from vehicle_tracker import VehicleTracker
-from config import DB_CONFIG
-import requests
+import queue
+import hashlib
+import functools
+import csv
+import io
+import base64
+import worker_loop
+from db_pool import db_pool
+from response_cache import cached_response
+from shared_cache import shared_cache
+from fence_store import save_fences, fence_snapshot
+from daily_rollups import aggregate_by_vehicle_info, load_historical_daily_page
+from position_feed import position_feed
+from upstream import AsyncTTLCache, get_client_session
+from refresh_queue import create_refresh_queue
+from json_provider import install as install_json_provider
+from config import VIDEO_URL_CACHE_TTL, SESSID_CACHE_TTL, SESSID_REFRESH_AHEAD
+from track_queries import (vehicles_day_tracks, latest_positions_on_day, daily_data_on_day, change_versions,
+                           changed_entities)
+from track_encoding import encode_track_polyline, encode_tracks_binary
+from track_simplify import simplify_track, zoom_to_tolerance, simplified_track_cache
 from session_manager import SessionManager
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+class WorkerLoopFlask(Flask):
+    """
+    async 视图统一运行在本进程的常驻事件循环上，而不是像 Flask 默认那样每个请求新建一个事件循环，
+    这样连接池、上游客户端等长连接资源可以在请求之间复用。
+    """
 
-# 配置缓存
-cache = Cache(app, config={'CACHE_TYPE': 'simple', 'CACHE_DEFAULT_TIMEOUT': 10})
-
-# 数据库连接信息
-if DB_CONFIG:
-    db_config = DB_CONFIG
-else:
-    db_config = {
-        # 'host': '111.173.89.238',
-        'host': 'localhost',
-        'user': 'yjj',
-        'password': 'pass',
-        'db': 'Cars'
-    }
+    def async_to_sync(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return worker_loop.run(func(*args, **kwargs))
+        return wrapper
+
+
+app = WorkerLoopFlask(__name__)
+# 有 orjson 时 jsonify 使用 orjson 序列化
+install_json_provider(app)
+CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
 # 实例化 SessionManager
 session_manager = SessionManager()
 
 
-async def connect_db():
-    return await aiomysql.connect(**db_config)
+# 按需刷新使用的 VehicleTracker，第一次刷新时才创建（日志文件、线程池和数据库连接池），
+# 没有收到按需刷新的 worker 进程不会创建
+_refresh_tracker = None
+_refresh_tracker_lock = threading.Lock()
 
 
-def make_cache_key():
-    date_str = request.args.get('date', 'default')
-    return f"{request.path}?date={date_str}"
+def refresh_track(license_plate, person=False):
+    """按需刷新队列的处理函数，返回值见 VehicleTracker.fetch_track_by_license_plate"""
+    global _refresh_tracker
+    with _refresh_tracker_lock:
+        if _refresh_tracker is None:
+            from vehicle_tracker import VehicleTracker
+            _refresh_tracker = VehicleTracker(loop_interval=5)  # 根据需要调整循环间隔时间
+    return _refresh_tracker.fetch_track_by_license_plate(license_plate, person)
 
 
-# 实例化 VehicleTracker
-vehicle_tracker = VehicleTracker(loop_interval=5)  # 根据需要调整循环间隔时间
+# 按需刷新单个车辆（人员）轨迹的队列
+refresh_queue = create_refresh_queue(refresh_track)
 
 
 # 启动 SessionManager 的异步任务
@@ -66,11 +87,160 @@ def start_async_task():
     loop.run_until_complete(start_session_manager())  # 启动异步任务
 
 
+# 增量查询时向前多取的微秒数：不同进程写入的版本号可能乱序提交，重复返回的记录对客户端无害。
+# 写入方在提交前才取版本号（见 insert_daily_data、store_chunk），取号到提交只有一两条语句，5 秒足够覆盖
+SINCE_OVERLAP_US = 5 * 1000000
+
+
+def parse_since():
+    """解析增量游标参数 since，未提供时返回 None，格式错误时抛出 ValueError"""
+    since_str = request.args.get('since')
+    return int(since_str) if since_str is not None else None
+
+
+def refresh_on_demand(person=False):
+    """
+    请求带 license_plate 时登记该车辆（人员）轨迹的按需刷新，不等待刷新完成，立即返回现有数据；
+    响应头 X-Refresh-Token 为刷新令牌，可用 /api/refresh_status 查询，刷新后的位置也会通过 SSE 推送。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            license_plate = request.args.get('license_plate')
+            token = refresh_queue.request(license_plate, person) if license_plate else None
+            response = app.make_response(await view(*args, **kwargs))
+            if token:
+                response.headers['X-Refresh-Token'] = token
+            return response
+        return wrapper
+    return decorator
+
+
+def body_etag(view):
+    """
+    以响应内容的摘要作为 ETag（缓存命中时使用缓存条目中保存的 ETag），客户端带 If-None-Match 且内容未变时返回 304。
+    ETag 只取决于实际返回的内容，缓存中的旧响应不会带上新数据的 ETag，车辆信息、人员信息的修改也会改变 ETag。
+    """
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        response = app.make_response(await view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        if not response.get_etag()[0]:
+            response.set_etag(hashlib.md5(response.get_data()).hexdigest())
+        return response.make_conditional(request)
+    return wrapper
+
+
+async def fetch_daily_data(vehicle_ids, date):
+    """查询 vehicle_daily_data，返回 vehicle_id 到当天统计的映射"""
+    daily_data = await db_pool.fetchall(*daily_data_on_day(vehicle_ids, date))
+    return {row[0]: {
+        'running_mileage': float(row[1]),
+        'driving_duration': row[2],
+        'parking_duration': row[3],
+        'engine_off_duration': row[4],
+        'current_status': row[5]
+    } for row in daily_data}
+
+
+async def load_vehicle_locations(date, vehicle_ids=None):
+    """组装车辆位置列表；vehicle_ids 为 None 时返回全部车辆"""
+    query = """
+        SELECT 
+            id, license_plate, carId, vehicle_group, project_category, terminal_model, terminal_number,
+            brand_model, vehicle_identification_number, engine_number, owner, vehicle_name, gross_weight, 
+            vehicle_type, driver, driver_phone, car_no
+        FROM VehicleInfo
+    """
+    params = None
+    if vehicle_ids is not None:
+        query += f" WHERE id IN ({','.join(['%s'] * len(vehicle_ids))})"
+        params = tuple(vehicle_ids)
+    vehicles = await db_pool.fetchall(query, params)
+    if not vehicles:
+        return []
+
+    # 查询vehicle_daily_data表中的数据
+    daily_data_dict = await fetch_daily_data([vehicle[0] for vehicle in vehicles], date)
+
+    # 一次性批量查询所有车辆当天的最后位置
+    tracks = await fetch_last_tracks([vehicle[0] for vehicle in vehicles if vehicle[0] in daily_data_dict])
+    return [handle_vehicle_data(vehicle, daily_data_dict.get(vehicle[0]), tracks.get(vehicle[0])) for vehicle in vehicles]
+
+
+async def load_person_locations(date, person_ids=None):
+    """组装人员位置列表；person_ids 为 None 时返回全部人员"""
+    query = """
+        SELECT Company, PersonnelID, BadgeNumber, Name, Gender, Age, PhoneNumber, Position, HomeAddress  FROM personnel
+    """
+    params = None
+    if person_ids is not None:
+        query += f" WHERE PersonnelID IN ({','.join(['%s'] * len(person_ids))})"
+        params = tuple(person_ids)
+    persons = await db_pool.fetchall(query, params)
+    if not persons:
+        return []
+
+    # 查询vehicle_daily_data表中的数据
+    daily_data_dict = await fetch_daily_data([person[1] for person in persons], date)
+
+    # 一次性批量查询所有人员当天的最后位置
+    tracks = await fetch_last_tracks([person[1] for person in persons if person[1] in daily_data_dict])
+    return [handle_person_data(person, daily_data_dict.get(person[1]), tracks.get(person[1])) for person in persons]
+
+
+def to_columns(records):
+    """
+    把记录列表转换为按列存放的格式（layout=columns）：每个字段一个数组，键名只出现一次，
+    车辆数量大时响应体积和序列化时间都明显减少。
+    """
+    fields = list(dict.fromkeys(field for record in records for field in record))
+    return {
+        'count': len(records),
+        'fields': fields,
+        'columns': {field: [record.get(field) for record in records] for field in fields},
+    }
+
+
+def parse_layout():
+    """解析返回格式参数 layout（rows 或 columns），格式错误时抛出 ValueError"""
+    layout = request.args.get('layout', 'rows')
+    if layout not in ('rows', 'columns'):
+        raise ValueError(layout)
+    return layout
+
+
+async def current_cursor(date):
+    """位置表和当天每日数据的最大版本号；必须在读取数据之前查询，之后提交的变化由下一次增量请求返回"""
+    versions = await db_pool.fetchone(*change_versions(date))
+    return max(versions[0], versions[1])
+
+
+async def load_changed_locations(loader, date, since):
+    """
+    增量模式：只返回版本号大于 since 的记录，以及下一次请求使用的游标。
+    since <= 0 时返回全部记录（包括从未变化过、版本号为 0 的记录）。
+    """
+    cursor = await current_cursor(date)
+    rows = await db_pool.fetchall(*changed_entities(date, since - SINCE_OVERLAP_US if since > 0 else -1))
+    changed_ids = [row[0] for row in rows]
+    changes = await loader(date, changed_ids) if changed_ids else []
+    return {'cursor': max(cursor, since), 'changes': changes}
+
+
+def with_cursor(response, cursor):
+    """完整响应在响应头 X-Cursor 中返回游标，客户端之后可以用 since=<游标> 增量查询"""
+    response.headers['X-Cursor'] = str(cursor)
+    return response
+
+
 @app.route('/api/last_locations', methods=['GET'])
-@cache.cached(timeout=5, key_prefix=make_cache_key)
+@refresh_on_demand(person=False)
+@body_etag
+@cached_response(ttl=5, stale_ttl=30, namespaces=('tracks', 'daily'), ignore_args=('license_plate',))
 async def get_last_locations():
     date_str = request.args.get('date')
-    license_plate = request.args.get('license_plate')
 
     if not date_str:
         return jsonify({"error": "Date parameter is required"}), 400
@@ -80,74 +250,43 @@ async def get_last_locations():
     except ValueError:
         return jsonify({"error": "Invalid date format, expected YYYYMMDD"}), 400
 
-    # 如果提供了车牌号，调用 VehicleTracker 来更新该车辆的轨迹
-    if license_plate:
-        try:
-            # 使用 asyncio.to_thread 来在后台线程中运行同步方法
-            await asyncio.to_thread(vehicle_tracker.fetch_track_by_license_plate, license_plate)
-            print(f"Successfully updated track for license plate: {license_plate}")
-        except Exception as e:
-            print(f"Error updating track for license plate {license_plate}: {e}")
+    try:
+        since = parse_since()
+    except ValueError:
+        return jsonify({"error": "Invalid since cursor, expected an integer"}), 400
 
-    connection = await connect_db()
-    cursor = await connection.cursor()
+    try:
+        layout = parse_layout()
+    except ValueError:
+        return jsonify({"error": "Invalid layout, expected rows or columns"}), 400
 
     try:
-        # 查询所有车辆信息
-        await cursor.execute("""
-            SELECT 
-                id, license_plate, carId, vehicle_group, project_category, terminal_model, terminal_number,
-                brand_model, vehicle_identification_number, engine_number, owner, vehicle_name, gross_weight, 
-                vehicle_type, driver, driver_phone, car_no
-            FROM VehicleInfo
-        """)
-        vehicles = await cursor.fetchall()
-
-        if not vehicles:
+        if since is not None:
+            changed = await load_changed_locations(load_vehicle_locations, date, since)
+            if layout == 'columns':
+                changed['changes'] = to_columns(changed['changes'])
+            return jsonify(changed)
+
+        cursor = await current_cursor(date)
+        results = await load_vehicle_locations(date)
+        if not results:
             return jsonify({"error": "No vehicles found"}), 404
 
-        vehicle_ids = [vehicle[0] for vehicle in vehicles]
-
-        # 构建IN查询的占位符
-        in_placeholders = ','.join(['%s'] * len(vehicle_ids))
-
-        # 查询vehicle_daily_data表中的数据
-        await cursor.execute(f"""
-            SELECT vehicle_id, running_mileage, driving_duration, parking_duration, engine_off_duration, current_status
-            FROM vehicle_daily_data
-            WHERE vehicle_id IN ({in_placeholders}) AND date = %s
-        """, (*vehicle_ids, date))
-        daily_data = await cursor.fetchall()
-
-        # 构建vehicle_id到daily_data的映射
-        daily_data_dict = {row[0]: {
-            'running_mileage': float(row[1]),
-            'driving_duration': row[2],
-            'parking_duration': row[3],
-            'engine_off_duration': row[4],
-            'current_status': row[5]
-        } for row in daily_data}
-
-        # 创建异步任务处理每辆车的数据
-        tasks = [handle_vehicle_data(vehicle, daily_data_dict.get(vehicle[0])) for vehicle in vehicles]
-        results = await asyncio.gather(*tasks)
-
     except Exception as e:
         print(f"Error in get_last_locations: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-    finally:
-        await cursor.close()
-        connection.close()
-
-    return jsonify(results)
+    if layout == 'columns':
+        return with_cursor(jsonify(to_columns(results)), cursor)
+    return with_cursor(jsonify(results), cursor)
 
 
 @app.route('/api/last_locations_person', methods=['GET'])
-@cache.cached(timeout=5, key_prefix=make_cache_key)
+@refresh_on_demand(person=True)
+@body_etag
+@cached_response(ttl=5, stale_ttl=30, namespaces=('tracks', 'daily'), ignore_args=('license_plate',))
 async def get_last_locations_person():
     date_str = request.args.get('date')
-    license_plate = request.args.get('license_plate')
 
     if not date_str:
         return jsonify({"error": "Date parameter is required"}), 400
@@ -157,75 +296,78 @@ async def get_last_locations_person():
     except ValueError:
         return jsonify({"error": "Invalid date format, expected YYYYMMDD"}), 400
 
-    # 如果提供了车牌号，调用 VehicleTracker 来更新该车辆的轨迹
-    if license_plate:
-        try:
-            # 使用 asyncio.to_thread 来在后台线程中运行同步方法
-            await asyncio.to_thread(vehicle_tracker.fetch_track_by_license_plate, license_plate, True)
-            print(f"Successfully updated track for license plate: {license_plate}")
-        except Exception as e:
-            print(f"Error updating track for license plate {license_plate}: {e}")
-
-    connection = await connect_db()
-    cursor = await connection.cursor()
+    try:
+        since = parse_since()
+    except ValueError:
+        return jsonify({"error": "Invalid since cursor, expected an integer"}), 400
 
     try:
-        # 查询所有车辆信息
-        await cursor.execute("""
-            SELECT Company, PersonnelID, BadgeNumber, Name, Gender, Age, PhoneNumber, Position, HomeAddress  FROM personnel
-        """)
-        vehicles = await cursor.fetchall()
+        layout = parse_layout()
+    except ValueError:
+        return jsonify({"error": "Invalid layout, expected rows or columns"}), 400
 
-        if not vehicles:
+    try:
+        if since is not None:
+            changed = await load_changed_locations(load_person_locations, date, since)
+            if layout == 'columns':
+                changed['changes'] = to_columns(changed['changes'])
+            return jsonify(changed)
+
+        cursor = await current_cursor(date)
+        results = await load_person_locations(date)
+        if not results:
             return jsonify({"error": "No vehicles found"}), 404
 
-        vehicle_ids = [vehicle[1] for vehicle in vehicles]
-
-        # 构建IN查询的占位符
-        in_placeholders = ','.join(['%s'] * len(vehicle_ids))
-
-        # 查询vehicle_daily_data表中的数据
-        await cursor.execute(f"""
-            SELECT vehicle_id, running_mileage, driving_duration, parking_duration, engine_off_duration, current_status
-            FROM vehicle_daily_data
-            WHERE vehicle_id IN ({in_placeholders}) AND date = %s
-        """, (*vehicle_ids, date))
-        daily_data = await cursor.fetchall()
-
-        # 构建vehicle_id到daily_data的映射
-        daily_data_dict = {row[0]: {
-            'running_mileage': float(row[1]),
-            'driving_duration': row[2],
-            'parking_duration': row[3],
-            'engine_off_duration': row[4],
-            'current_status': row[5]
-        } for row in daily_data}
-
-
-        # 创建异步任务处理每辆车的数据
-        tasks = [handle_person_data(vehicle, daily_data_dict.get(vehicle[1])) for vehicle in vehicles]
-        results = await asyncio.gather(*tasks)
-
     except Exception as e:
         print(f"Error in get_last_locations: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-    finally:
-        await cursor.close()
-        connection.close()
+    if layout == 'columns':
+        return with_cursor(jsonify(to_columns(results)), cursor)
+    return with_cursor(jsonify(results), cursor)
 
-    return jsonify(results)
 
+def format_sse_event(event, data):
+    """序列化一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
 
 
-# 处理单个车辆数据的异步函数
-async def handle_vehicle_data(vehicle, daily_data):
+# 以 Server-Sent Events 推送车辆（人员）位置与状态的变化：先推送完整快照，之后只推送变化的记录。
+# 每个连接占用一个 WSGI 线程，只用于开发模式；生产环境（asgi.py）由事件循环直接处理这个路径
+@app.route('/api/last_locations/stream', methods=['GET'])
+def stream_last_locations():
+    position_feed.start()
+    subscriber = position_feed.subscribe()
+    if subscriber is None:
+        return jsonify({"error": "Too many subscribers"}), 503
+
+    def generate():
+        try:
+            yield format_sse_event('snapshot', position_feed.snapshot())
+            while True:
+                try:
+                    changes = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if changes is None:
+                    break
+                yield format_sse_event('changes', changes)
+        finally:
+            position_feed.unsubscribe(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# 组装单个车辆的返回数据
+def handle_vehicle_data(vehicle, daily_data, track):
     (vehicle_id, license_plate, car_id, vehicle_group, project_category, terminal_model, terminal_number, \
      brand_model, vehicle_identification_number, engine_number, owner, vehicle_name, gross_weight, vehicle_type,
      driver, driver_phone, car_no) = vehicle
 
-    # 获取当天最后的轨迹信息
-    track = await fetch_track_info(vehicle_id, daily_data)
+    # 没有当天数据或轨迹时返回空位置
+    track = track or EMPTY_TRACK
 
     # 初始化返回数据
     result = {
@@ -257,12 +399,12 @@ async def handle_vehicle_data(vehicle, daily_data):
 
     return result
 
-# 处理单个车辆数据的异步函数
-async def handle_person_data(person, daily_data):
+# 组装单个人员的返回数据
+def handle_person_data(person, daily_data, track):
     (Company, PersonnelID, BadgeNumber, Name, Gender, Age, PhoneNumber, Position, HomeAddress) = person
 
-    # 获取当天最后的轨迹信息
-    track = await fetch_track_info(PersonnelID, daily_data)
+    # 没有当天数据或轨迹时返回空位置
+    track = track or EMPTY_TRACK
 
     # 初始化返回数据
     result = {
@@ -302,38 +444,29 @@ def format_duration(seconds):
     return formatted
 
 
-# Fetch track info separately to avoid sharing the cursor concurrently
-async def fetch_track_info(vehicle_id, daily_data):
-    if not daily_data:
-        return {'latitude': None, 'longitude': None, 'last_time': None}
+EMPTY_TRACK = {'latitude': None, 'longitude': None, 'last_time': None}
 
-    connection = await connect_db()
-    cursor = await connection.cursor()
+
+# 批量获取多个车辆（或人员）当天的最后轨迹点，直接读取跟踪器维护的最新位置表
+async def fetch_last_tracks(vehicle_ids, track_date=None):
+    if not vehicle_ids:
+        return {}
+
+    track_date = track_date or datetime.now().date()
     try:
-        await cursor.execute("""
-            SELECT latitude, longitude, track_time
-            FROM VehicleTrack
-            WHERE vehicle_id = %s AND DATE(track_time) = %s
-            ORDER BY track_time DESC
-            LIMIT 1
-        """, (vehicle_id, daily_data['date'] if 'date' in daily_data else datetime.now().date()))
-        track = await cursor.fetchone()
+        rows = await db_pool.fetchall(*latest_positions_on_day(vehicle_ids, track_date))
     except Exception as e:
-        print(f"Error fetching track info for vehicle {vehicle_id}: {e}")
-        track = None
-    finally:
-        await cursor.close()
-        connection.close()
+        print(f"Error fetching last tracks: {e}")
+        return {}
 
-    if track:
-        latitude, longitude, track_time = track
-        return {
+    tracks = {}
+    for vehicle_id, latitude, longitude, track_time in rows:
+        tracks[vehicle_id] = {
             'latitude': latitude,
             'longitude': longitude,
             'last_time': track_time.strftime('%Y-%m-%d %H:%M:%S') if track_time else None
         }
-    else:
-        return {'latitude': None, 'longitude': None, 'last_time': None}
+    return tracks
 
 
 # Process track information to separate data logic
@@ -351,6 +484,17 @@ def process_track_info(track):
     return status, latitude, longitude, last_time
 
 
+# 按 tolerance（米）或 zoom（地图缩放级别）简化轨迹行 (latitude, longitude, track_time)
+def simplify_track_rows(rows, tolerance, zoom):
+    if not rows or (tolerance is None and zoom is None):
+        return rows
+    latitudes = [row[0] for row in rows]
+    longitudes = [row[1] for row in rows]
+    if tolerance is None:
+        tolerance = zoom_to_tolerance(zoom, float(latitudes[len(latitudes) // 2]))
+    return [rows[i] for i in simplify_track(latitudes, longitudes, tolerance)]
+
+
 @app.route('/api/vehicle_tracks', methods=['GET'])
 async def get_vehicle_tracks():
     vehicle_id = request.args.get('vehicle_id')
@@ -363,21 +507,87 @@ async def get_vehicle_tracks():
     except ValueError:
         return jsonify({"error": "Invalid date format"}), 400
 
-    connection = await connect_db()
-    cursor = await connection.cursor()
-    await cursor.execute("""
-        SELECT latitude, longitude, track_time
-        FROM VehicleTrack
-        WHERE vehicle_id = %s AND DATE(track_time) = %s
-        ORDER BY track_time
-    """, (vehicle_id, date))
-    tracks = await cursor.fetchall()
-    await cursor.close()
-    connection.close()
-
-    response = [{'latitude': track[0], 'longitude': track[1], 'time': track[2].strftime('%Y-%m-%d %H:%M:%S')} for track
-                in tracks]
-    return jsonify(response)
+    # 可选的轨迹简化参数：tolerance（米）或 zoom（地图缩放级别）
+    try:
+        tolerance = float(request.args['tolerance']) if 'tolerance' in request.args else None
+        zoom = int(request.args['zoom']) if 'zoom' in request.args else None
+    except ValueError:
+        return jsonify({"error": "Invalid tolerance or zoom"}), 400
+
+    # 紧凑格式：polyline（编码折线 JSON）或 binary（打包 int32 数组），支持 vehicle_ids 一次查询多辆车
+    response_format = request.args.get('format', 'json')
+    if response_format in ('polyline', 'binary'):
+        vehicle_ids = [v.strip() for v in request.args.get('vehicle_ids', '').split(',') if v.strip()]
+        if not vehicle_ids and vehicle_id:
+            vehicle_ids = [vehicle_id]
+        if not vehicle_ids:
+            return jsonify({"error": "vehicle_id or vehicle_ids parameter is required"}), 400
+        return await get_vehicle_tracks_compact(vehicle_ids, date, tolerance, zoom, response_format)
+    if response_format != 'json':
+        return jsonify({"error": "Invalid format, expected json, polyline or binary"}), 400
+
+    tracks = await load_simplified_tracks([vehicle_id], date, tolerance, zoom)
+    _, rows = tracks.get(str(vehicle_id), (vehicle_id, []))
+    return jsonify([{'latitude': row[0], 'longitude': row[1], 'time': row[2].strftime('%Y-%m-%d %H:%M:%S')}
+                    for row in rows])
+
+
+async def load_simplified_tracks(vehicle_ids, date, tolerance, zoom):
+    """
+    多个车辆（人员）某天的轨迹，指定 tolerance 或 zoom 时简化。
+    简化结果按 (车辆, 日期, 容差) 缓存在 simplified_track_cache 中，JSON 与紧凑格式共用，只查询缓存中没有的车辆。
+
+    :return: {str(车辆ID): (数据库中的车辆ID, [(latitude, longitude, track_time)])}。
+    """
+    simplify_key = ('tolerance', tolerance) if tolerance is not None else ('zoom', zoom) if zoom is not None else None
+    date_str = date.strftime('%Y%m%d')
+
+    tracks = {}
+    missing = []
+    for vehicle_id in dict.fromkeys(str(v) for v in vehicle_ids):
+        cached = simplified_track_cache.get((vehicle_id, date_str, simplify_key)) if simplify_key else None
+        if cached is None:
+            missing.append(vehicle_id)
+        else:
+            tracks[vehicle_id] = cached
+    if not missing:
+        return tracks
+
+    # 按车辆分组（查询结果已按车辆、时间排序）
+    rows = await db_pool.fetchall(*vehicles_day_tracks(missing, date))
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(str(row[0]), (row[0], []))[1].append(row[1:])
+
+    is_today = date.date() >= datetime.now().date()
+    for vehicle_id in missing:
+        track_vehicle_id, vehicle_rows = grouped.get(vehicle_id, (vehicle_id, []))
+        tracks[vehicle_id] = (track_vehicle_id, simplify_track_rows(vehicle_rows, tolerance, zoom))
+        if simplify_key:
+            simplified_track_cache.set((vehicle_id, date_str, simplify_key), tracks[vehicle_id], is_today=is_today)
+    return tracks
+
+
+async def get_vehicle_tracks_compact(vehicle_ids, date, tolerance, zoom, response_format):
+    tracks = []
+    for track_vehicle_id, vehicle_rows in (await load_simplified_tracks(vehicle_ids, date, tolerance, zoom)).values():
+        if not vehicle_rows:
+            continue
+        tracks.append((
+            track_vehicle_id,
+            [row[0] for row in vehicle_rows],
+            [row[1] for row in vehicle_rows],
+            [row[2] for row in vehicle_rows],
+        ))
+
+    if response_format == 'binary':
+        return Response(encode_tracks_binary(tracks), mimetype='application/octet-stream')
+
+    return jsonify({
+        'format': 'polyline',
+        'precision': 5,
+        'tracks': [encode_track_polyline(*track) for track in tracks],
+    })
 
 
 @app.route('/api/save_fence', methods=['POST'])
@@ -385,88 +595,60 @@ async def save_fence():
     data = request.get_json()
     fences = data.get('fences', [])
 
-    connection = await connect_db()
-    cursor = await connection.cursor()
+    async def save(connection, cursor):
+        return await save_fences(cursor, fences)
 
     try:
-        # 先清空数据库中的所有围栏信息
-        await cursor.execute("DELETE FROM FencePoints")
-        await cursor.execute("DELETE FROM Fences")
-        await connection.commit()
-
-        if not fences:  # 即使没有围栏，也允许保存
-            return jsonify({"success": True, "message": "没有围栏数据，但已清除现有的围栏信息。"})
-
-        for i, fence in enumerate(fences):
-            name = f"围栏 {i + 1}"
-
-            await cursor.execute("INSERT INTO Fences (name, created_at) VALUES (%s, %s)", (name, datetime.now()))
-            fence_id = cursor.lastrowid
-
-            for j, point in enumerate(fence):
-                await cursor.execute("""
-                    INSERT INTO FencePoints (fence_id, latitude, longitude, point_order) 
-                    VALUES (%s, %s, %s, %s)
-                """, (fence_id, point['lat'], point['lng'], j))
-
-        await connection.commit()
-        return jsonify({"success": True, "message": "围栏已成功保存。"})
-
+        result = await db_pool.transaction(save)
     except Exception as e:
-        await connection.rollback()
         print(f"Error saving fence: {e}")
         return jsonify({"error": "围栏保存失败。"}), 500
 
-    finally:
-        await cursor.close()
-        connection.close()
+    shared_cache.invalidate('fences')
+    if not fences:  # 即使没有围栏，也允许保存
+        return jsonify({"success": True, "message": "没有围栏数据，但已清除现有的围栏信息。", **result})
+    return jsonify({"success": True, "message": "围栏已成功保存。", **result})
 
 
 @app.route('/api/get_fences', methods=['GET'])
 async def get_fences():
-    connection = await connect_db()
-    cursor = await connection.cursor()
-
     try:
-        await cursor.execute("""
-            SELECT F.id, F.name, FP.latitude, FP.longitude, FP.point_order
-            FROM Fences F
-            JOIN FencePoints FP ON F.id = FP.fence_id
-            ORDER BY F.id, FP.point_order
-        """)
-        results = await cursor.fetchall()
-
-        fences = {}
-        for row in results:
-            fence_id = row[0]
-            name = row[1]
-            lat = row[2]
-            lng = row[3]
-            point_order = row[4]
-
-            if fence_id not in fences:
-                fences[fence_id] = {
-                    'name': name,
-                    'points': []
-                }
-
-            fences[fence_id]['points'].append({
-                'lat': lat,
-                'lng': lng,
-                'order': point_order
-            })
-
-        response = [{'id': fence_id, 'name': fence['name'], 'points': fence['points']} for fence_id, fence in
-                    fences.items()]
-        return jsonify(response)
-
+        snapshot = await fence_snapshot.get(app.json.dumps)
     except Exception as e:
         print(f"Error retrieving fences: {e}")
         return jsonify({"error": "Failed to retrieve fences"}), 500
 
-    finally:
-        await cursor.close()
-        connection.close()
+    # 围栏未变化时直接返回 304，变化后才返回预先序列化好的 JSON
+    if snapshot.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+VIDEO_URL_PROVIDER = 'http://220.178.1.18:8542/GPSBaseserver/videoUrlProvider/getVideoUrl.do'
+
+# 视频地址缓存：多人同时打开同一车辆的视频时只请求一次上游
+video_url_cache = AsyncTTLCache(ttl=VIDEO_URL_CACHE_TTL)
+
+
+async def fetch_video_url(vehicle_num):
+    """通过共享的 keep-alive 客户端向上游请求车辆的视频地址"""
+    session_id = await asyncio.to_thread(session_manager.get_session_id)
+    session = get_client_session()
+    async with session.post(
+            VIDEO_URL_PROVIDER,
+            json={
+                "userName": session_manager.username,
+                "password": session_manager.password,
+                "vehicleNum": vehicle_num,
+                "sessionId": session_id
+            }
+    ) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
 
 
 @app.route('/api/get_video_url', methods=['POST'])
@@ -477,32 +659,150 @@ async def get_video_url():
         return jsonify({"error": "Vehicle number is required"}), 400
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                    'http://220.178.1.18:8542/GPSBaseserver/videoUrlProvider/getVideoUrl.do',
-                    json={
-                        "userName": "ahhygs",
-                        "password": "Hyhw240720@hy",
-                        "vehicleNum": vehicle_num,
-                        "sessionId": "57c7ccea-5e8c-493a-8ac8-db8598deadac-02333474"
-                    }
-            ) as response:
-                response.raise_for_status()
-                result = await response.json()
-                return jsonify(result)
+        video_url_cache.prune()
+        result = await video_url_cache.get_or_load(vehicle_num, lambda: fetch_video_url(vehicle_num))
+        return jsonify(result)
     except Exception as e:
         print(f"Error fetching video URLs for vehicle {vehicle_num}: {e}")
         return jsonify({"error": "Failed to fetch video URLs"}), 500
 
 
+def historical_daily_query(start_date, end_date, companies, license_plates):
+    """
+    指定车牌在区间内的全部每日数据，按 (车牌, 车辆ID, 日期) 排序，用于不分页的查询和 CSV 导出；
+    没有当天数据的车辆只有一行且 date 为 NULL。分页查询见 daily_rollups.load_historical_daily_page。
+    """
+    company_placeholders = ','.join(['%s'] * len(companies))
+    license_plate_placeholders = ','.join(['%s'] * len(license_plates))
+    params = [start_date, end_date, *companies, *license_plates]
+
+    query = f"""
+        SELECT 
+            vi.license_plate, 
+            vi.project_category, 
+            vi.driver,
+            vi.driver_phone,
+            vi.vehicle_type,
+            vi.vehicle_name,
+            vdd.date,
+            COALESCE(vdd.running_mileage, 0) AS running_mileage,
+            COALESCE(vdd.driving_duration, 0) AS driving_duration,
+            COALESCE(vdd.parking_duration, 0) AS parking_duration,
+            COALESCE(vdd.engine_off_duration, 0) AS engine_off_duration,
+            vi.id AS vehicle_info_id
+        FROM vehicleinfo vi
+        LEFT JOIN vehicle_daily_data vdd 
+            ON vi.id = vdd.vehicle_id 
+            AND vdd.date BETWEEN %s AND %s
+        WHERE vi.project_category IN ({company_placeholders})
+        AND vi.license_plate IN ({license_plate_placeholders})
+        ORDER BY vi.license_plate, vi.id, vdd.date
+    """
+    return query, params
+
+
+def encode_page_cursor(row):
+    """把每日数据的最后一行编码为不透明的续页游标"""
+    license_plate, date, vehicle_info_id = row[0], row[6], row[11]
+    payload = json.dumps([license_plate, vehicle_info_id, date.isoformat() if date else None], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(cursor):
+    """解析续页游标，格式错误时抛出 ValueError"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        license_plate, vehicle_info_id, date_str = json.loads(payload)
+        date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else None
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    return license_plate, vehicle_info_id, date
+
+
+# 每日数据分页的最大每页行数
+HISTORICAL_PAGE_LIMIT_MAX = 5000
+
+
+HISTORICAL_DAILY_FIELDS = ('license_plate', 'project_category', 'driver', 'driver_phone', 'vehicle_type',
+                           'vehicle_name', 'date', 'running_mileage', 'driving_duration', 'parking_duration',
+                           'engine_off_duration')
+HISTORICAL_TOTAL_FIELDS = tuple(field for field in HISTORICAL_DAILY_FIELDS if field != 'date')
+
+
+def format_historical_daily_row(row):
+    license_plate, project_category, driver, driver_phone, vehicle_type, vehicle_name, date, running_mileage, driving_duration, parking_duration, engine_off_duration = row[:11]
+    return {
+        'license_plate': license_plate,
+        'project_category': project_category,
+        'driver': driver,
+        'driver_phone': driver_phone,
+        'vehicle_type': vehicle_type,
+        'vehicle_name': vehicle_name,
+        'date': date.strftime('%Y-%m-%d') if date else 'N/A',
+        'running_mileage': float(running_mileage) if running_mileage else 0.0,
+        'driving_duration': int(driving_duration) if driving_duration else 0,
+        'parking_duration': int(parking_duration) if parking_duration else 0,
+        'engine_off_duration': int(engine_off_duration) if engine_off_duration else 0
+    }
+
+
+def format_historical_total_row(row):
+    license_plate, project_category, driver, driver_phone, vehicle_type, vehicle_name, running_mileage, driving_duration, parking_duration, engine_off_duration = row
+    return {
+        'license_plate': license_plate,
+        'project_category': project_category,
+        'driver': driver,
+        'driver_phone': driver_phone,
+        'vehicle_type': vehicle_type,
+        'vehicle_name': vehicle_name,
+        'running_mileage': float(running_mileage) if running_mileage else 0.0,
+        'driving_duration': int(driving_duration) if driving_duration else 0,
+        'parking_duration': int(parking_duration) if parking_duration else 0,
+        'engine_off_duration': int(engine_off_duration) if engine_off_duration else 0
+    }
+
+
+def stream_csv(query, params, fields, format_row, filename):
+    """
+    用服务端游标逐批读取查询结果并以分块 CSV 返回，内存占用与导出的行数无关。
+    带 UTF-8 BOM，Excel 打开时中文不乱码。
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        yield '\ufeff' + buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+        try:
+            for rows in db_pool.stream(query, params):
+                for row in rows:
+                    record = format_row(row)
+                    writer.writerow([record[field] for field in fields])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        except Exception as e:
+            # 响应头已经发出，只能记录错误并截断输出
+            print(f"Error exporting historical data: {e}")
+
+    return Response(generate(), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'X-Accel-Buffering': 'no'})
+
+
 # 新增接口：/api/historical_data
+# export=csv 时以流式 CSV 导出，不经过响应缓存
 @app.route('/api/historical_data', methods=['GET'])
+@cached_response(ttl=60, stale_ttl=300, namespaces=('daily',), bypass_args=('export',))
 async def get_historical_data():
     # 获取查询参数
     start_date_str = request.args.get('startDate')
     end_date_str = request.args.get('endDate')
     companies_str = request.args.get('companies')
     license_plates_str = request.args.get('licensePlates')
+    export = request.args.get('export')
 
     # 验证参数是否存在
     if not start_date_str or not end_date_str or not companies_str:
@@ -518,6 +818,9 @@ async def get_historical_data():
     if start_date > end_date:
         return jsonify({"error": "startDate cannot be after endDate"}), 400
 
+    if export and export != 'csv':
+        return jsonify({"error": "Unsupported export format, expected csv"}), 400
+
     # 解析companies
     companies = [company.strip() for company in companies_str.split(',') if company.strip()]
     if not companies:
@@ -526,134 +829,114 @@ async def get_historical_data():
     # 解析license_plates
     license_plates = [plate.strip() for plate in license_plates_str.split(',')] if license_plates_str else []
 
-    connection = await connect_db()
-    cursor = await connection.cursor()
+    # 每日数据的键集分页：limit 为每页行数，cursor 为上一页返回的 next_cursor
+    page_limit = None
+    after = None
+    if license_plates and not export and ('limit' in request.args or 'cursor' in request.args):
+        try:
+            page_limit = int(request.args.get('limit', 1000))
+            if not 1 <= page_limit <= HISTORICAL_PAGE_LIMIT_MAX:
+                raise ValueError(page_limit)
+        except ValueError:
+            return jsonify({"error": f"limit must be between 1 and {HISTORICAL_PAGE_LIMIT_MAX}"}), 400
+        if request.args.get('cursor'):
+            try:
+                after = decode_page_cursor(request.args['cursor'])
+            except ValueError:
+                return jsonify({"error": "Invalid cursor"}), 400
+
+    # 分页查询：多取一行用于判断是否还有下一页
+    if page_limit:
+        try:
+            results = await load_historical_daily_page(db_pool.fetchall, start_date, end_date, companies,
+                                                       license_plates, after, page_limit + 1)
+        except Exception as e:
+            print(f"Error in get_historical_data: {e}")
+            return jsonify({"error": "Internal server error"}), 500
+        page = results[:page_limit]
+        next_cursor = encode_page_cursor(page[-1]) if len(results) > page_limit else None
+        return jsonify({'data': [format_historical_daily_row(row) for row in page], 'next_cursor': next_cursor})
+
+    # 如果提供了车牌号，则查询每日数据；否则进行统计查询（整月、整周部分读取预汇总表）
+    if license_plates:
+        query, params = historical_daily_query(start_date, end_date, companies, license_plates)
+        fields, format_row = HISTORICAL_DAILY_FIELDS, format_historical_daily_row
+    else:
+        query, params = aggregate_by_vehicle_info(start_date, end_date, companies)
+        fields, format_row = HISTORICAL_TOTAL_FIELDS, format_historical_total_row
 
-    try:
-        # 如果提供了车牌号，则查询每日数据
-        if license_plates:
-            # 构建IN查询的占位符
-            company_placeholders = ','.join(['%s'] * len(companies))
-            license_plate_placeholders = ','.join(['%s'] * len(license_plates))
-            params = [start_date, end_date, *companies, *license_plates]
-
-            query = f"""
-                SELECT 
-                    vi.license_plate, 
-                    vi.project_category, 
-                    vi.driver,
-                    vi.driver_phone,
-                    vi.vehicle_type,
-                    vi.vehicle_name,
-                    vdd.date,
-                    COALESCE(vdd.running_mileage, 0) AS running_mileage,
-                    COALESCE(vdd.driving_duration, 0) AS driving_duration,
-                    COALESCE(vdd.parking_duration, 0) AS parking_duration,
-                    COALESCE(vdd.engine_off_duration, 0) AS engine_off_duration
-                FROM vehicleinfo vi
-                LEFT JOIN vehicle_daily_data vdd 
-                    ON vi.id = vdd.vehicle_id 
-                    AND vdd.date BETWEEN %s AND %s
-                WHERE vi.project_category IN ({company_placeholders})
-                AND vi.license_plate IN ({license_plate_placeholders})
-                ORDER BY vi.license_plate, vdd.date
-            """
-
-            await cursor.execute(query, params)
-            results = await cursor.fetchall()
-
-            # 构建响应数据
-            historical_data = []
-            for row in results:
-                license_plate, project_category, driver, driver_phone, vehicle_type, vehicle_name, date, running_mileage, driving_duration, parking_duration, engine_off_duration = row
-                historical_data.append({
-                    'license_plate': license_plate,
-                    'project_category': project_category,
-                    'driver': driver,
-                    'driver_phone': driver_phone,
-                    'vehicle_type': vehicle_type,
-                    'vehicle_name': vehicle_name,
-                    'date': date.strftime('%Y-%m-%d') if date else 'N/A',
-                    'running_mileage': float(running_mileage) if running_mileage else 0.0,
-                    'driving_duration': int(driving_duration) if driving_duration else 0,
-                    'parking_duration': int(parking_duration) if parking_duration else 0,
-                    'engine_off_duration': int(engine_off_duration) if engine_off_duration else 0
-                })
-
-        # 如果没有提供车牌号，则进行统计查询
-        else:
-            # 构建IN查询的占位符
-            company_placeholders = ','.join(['%s'] * len(companies))
-            params = [start_date, end_date, *companies]
-
-            query = f"""
-                SELECT 
-                    vi.license_plate, 
-                    vi.project_category, 
-                    vi.driver,
-                    vi.driver_phone,
-                    vi.vehicle_type,
-                    vi.vehicle_name,
-                    COALESCE(SUM(vdd.running_mileage), 0) AS total_running_mileage,
-                    COALESCE(SUM(vdd.driving_duration), 0) AS total_driving_duration,
-                    COALESCE(SUM(vdd.parking_duration), 0) AS total_parking_duration,
-                    COALESCE(SUM(vdd.engine_off_duration), 0) AS total_engine_off_duration
-                FROM vehicleinfo vi
-                LEFT JOIN vehicle_daily_data vdd 
-                    ON vi.id = vdd.vehicle_id 
-                    AND vdd.date BETWEEN %s AND %s
-                WHERE vi.project_category IN ({company_placeholders})
-                GROUP BY vi.license_plate, vi.project_category, vi.driver, vi.driver_phone, vi.vehicle_type, vi.vehicle_name
-                ORDER BY vi.license_plate, vi.project_category
-            """
-
-            await cursor.execute(query, params)
-            results = await cursor.fetchall()
-
-            # 构建响应数据
-            historical_data = []
-            for row in results:
-                license_plate, project_category, driver, driver_phone, vehicle_type, vehicle_name, running_mileage, driving_duration, parking_duration, engine_off_duration = row
-                historical_data.append({
-                    'license_plate': license_plate,
-                    'project_category': project_category,
-                    'driver': driver,
-                    'driver_phone': driver_phone,
-                    'vehicle_type': vehicle_type,
-                    'vehicle_name': vehicle_name,
-                    'running_mileage': float(running_mileage) if running_mileage else 0.0,
-                    'driving_duration': int(driving_duration) if driving_duration else 0,
-                    'parking_duration': int(parking_duration) if parking_duration else 0,
-                    'engine_off_duration': int(engine_off_duration) if engine_off_duration else 0
-                })
+    if export == 'csv':
+        filename = f"historical_data_{start_date:%Y%m%d}_{end_date:%Y%m%d}.csv"
+        return stream_csv(query, params, fields, format_row, filename)
 
+    try:
+        results = await db_pool.fetchall(query, params)
     except Exception as e:
         print(f"Error in get_historical_data: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-    finally:
-        await cursor.close()
-        connection.close()
-
+    # 构建响应数据
+    historical_data = [format_row(row) for row in results]
     return jsonify(historical_data)
 
 
+@app.route('/api/refresh_status', methods=['GET'])
+def get_refresh_status():
+    token = request.args.get('token')
+    if not token:
+        return jsonify({"error": "token parameter is required"}), 400
+    status = refresh_queue.status(token)
+    if status is None:
+        return jsonify({"error": "Unknown or expired refresh token"}), 404
+    return jsonify(status)
+
+
+@app.route('/api/db_pool_stats', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify(db_pool.stats())
+
+
+SESSID_LOGIN_URL = 'https://v.topevery.com/StandardApiAction_login.action?account=CYJDHYHW&password=CY@jdhw1024'
+
+
+class SessidLoginError(Exception):
+    """视频平台登录失败，details 为平台返回的数据"""
+
+    def __init__(self, details):
+        super().__init__('Failed to get sessid')
+        self.details = details
+
+
+# 登录得到的 jsession 在进程内缓存，过期前在后台提前刷新；同时只有一个登录请求
+sessid_cache = AsyncTTLCache(ttl=SESSID_CACHE_TTL, refresh_ahead=SESSID_REFRESH_AHEAD)
+
+
+async def login_sessid():
+    session = get_client_session()
+    async with session.get(SESSID_LOGIN_URL) as response:
+        data = await response.json(content_type=None)
+    if data.get('result') == 0 and 'jsession' in data:
+        return data['jsession']
+    raise SessidLoginError(data)
+
+
 @app.route('/api/get_sessid', methods=['GET'])
-def get_sessid():
-    login_url = f'https://v.topevery.com/StandardApiAction_login.action?account=CYJDHYHW&password=CY@jdhw1024'
+async def get_sessid():
     try:
-        response = requests.get(login_url)
-        data = response.json()
-        if data.get('result') == 0 and 'jsession' in data:
-            sessid = data['jsession']
-            return jsonify({'sessid': sessid})
-        else:
-            return jsonify({'error': 'Failed to get sessid', 'details': data}), 500
+        sessid = await sessid_cache.get_or_load('jsession', login_sessid)
+        return jsonify({'sessid': sessid})
+    except SessidLoginError as e:
+        return jsonify({'error': 'Failed to get sessid', 'details': e.details}), 500
     except Exception as e:
         return jsonify({'error': 'Exception occurred', 'details': str(e)}), 500
 
 
+# 开发模式：单进程运行 API 并在同一进程中启动跟踪器。
+# 生产环境请分别运行 `python database_updater.py`（跟踪器）和 `python asgi.py`（多 worker 的 API 服务）。
 if __name__ == '__main__':
+    # 跟踪器只在开发模式（python api.py）中随 API 一起启动，asgi.py 的 worker 进程不导入
+    from database_updater import main as start_all_trackers
+
     # 启动数据库更新器（跟踪器）线程
     tracker_thread = threading.Thread(target=start_all_trackers)
     tracker_thread.start()
@@ -0,0 +1,106 @@
+# asgi.py
+#
+# 生产环境 API 入口：ASGI 应用 + 多 worker 进程，跟踪器不在 web worker 中运行。
+#   跟踪器：  python database_updater.py
+#   API 服务：python asgi.py   （或 uvicorn asgi:asgi_app --host 0.0.0.0 --port 8011 --workers 4）
+
+import asyncio
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from config import API_SERVER
+import worker_loop
+from upstream import close_client_session
+from position_feed import position_feed
+from api import app, format_sse_event
+
+# 推送连接在事件循环上直接处理，不经过 WSGI 线程池，连接数不受 API_SERVER['threads'] 限制
+STREAM_PATH = '/api/last_locations/stream'
+SSE_KEEPALIVE_SECONDS = 15
+
+# Flask 视图在线程池中执行，async 视图再提交回本 worker 的事件循环
+wsgi_middleware = WSGIMiddleware(app, workers=API_SERVER['threads'])
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def send_sse(send, text):
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+
+async def stream_last_locations(scope, receive, send):
+    """/api/last_locations/stream 的 ASGI 实现，推送内容与 api.stream_last_locations 相同"""
+    position_feed.start()
+    subscriber = position_feed.subscribe_async()
+    if subscriber is None:
+        await send({'type': 'http.response.start', 'status': 503,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': b'{"error": "Too many subscribers"}'})
+        return
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        headers = [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]
+        # 与 api.py 中 CORS(origins='*', supports_credentials=True) 的响应头一致
+        origin = dict(scope['headers']).get(b'origin')
+        if origin:
+            headers += [(b'access-control-allow-origin', origin), (b'access-control-allow-credentials', b'true'),
+                        (b'vary', b'Origin')]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send_sse(send, format_sse_event('snapshot', await position_feed.snapshot_async()))
+
+        while not disconnected.done():
+            next_changes = asyncio.ensure_future(subscriber.get())
+            await asyncio.wait({next_changes, disconnected}, timeout=SSE_KEEPALIVE_SECONDS,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not next_changes.done():
+                next_changes.cancel()
+                if not disconnected.done():
+                    await send_sse(send, ": keepalive\n\n")
+                continue
+            changes = next_changes.result()
+            if changes is None:
+                break
+            await send_sse(send, format_sse_event('changes', changes))
+
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    except OSError:
+        # 客户端已断开，发送失败
+        pass
+    finally:
+        position_feed.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+async def asgi_app(scope, receive, send):
+    # ASGI 服务器的事件循环即本 worker 的常驻事件循环，连接池、上游客户端都在其上运行
+    worker_loop.use_loop(asyncio.get_running_loop())
+
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_client_session()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH and scope['method'] == 'GET':
+        await stream_last_locations(scope, receive, send)
+        return
+
+    await wsgi_middleware(scope, receive, send)
+
+
+if __name__ == '__main__':
+    uvicorn.run('asgi:asgi_app', host=API_SERVER['host'], port=API_SERVER['port'], workers=API_SERVER['workers'])
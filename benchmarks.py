@@ -0,0 +1,177 @@
+# benchmarks.py
+#
+# 性能测试脚本，每个子命令对应一项测试：
+#   python benchmarks.py api --url http://127.0.0.1:8011/api/last_locations?date=20241001 --concurrency 50 --duration 30
+#   python benchmarks.py json --vehicles 5000
+#   python benchmarks.py gcj02 --points 200000
+#
+# API 吞吐量对比方法：
+#   1. 开发模式：python api.py，运行 api 子命令记录结果；
+#   2. 生产模式：python database_updater.py 与 python asgi.py 分开运行，使用相同参数再运行一次。
+#
+# 参考结果（--concurrency 50 --duration 15，单核虚拟机、压测客户端与服务在同一台机器，没有 MySQL，
+# 只测不访问数据库的路径；/api/last_locations 不带 date 时经过全部 async 装饰器后返回 400，计入错误数）：
+#                                    开发模式（Flask 内置服务器）  asgi.py 4 worker   uvicorn 1 worker
+#   /api/db_pool_stats                1105 req/s, p99 71 ms       856 req/s, 172 ms   747 req/s, 109 ms
+#   /api/last_locations（400）         937 req/s, p99 90 ms       558 req/s, 231 ms   571 req/s, 122 ms
+# 单核上多 worker 只增加切换开销；ASGI 的收益（多核并行、SSE 连接不占线程）需要在多核服务器上带数据库复测。
+
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from decimal import Decimal
+import aiohttp
+import numpy as np
+import coords
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+async def bench_api(url, concurrency, duration):
+    """在 duration 秒内以 concurrency 个并发连接反复请求 url，统计每秒请求数与延迟"""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(session):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*[worker(session) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"URL: {url}")
+    print(f"并发: {concurrency}，时长: {elapsed:.1f} 秒，请求数: {len(latencies)}，错误: {errors}")
+    print(f"吞吐量: {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"延迟 p50: {statistics.median(latencies) * 1000:.1f} ms，"
+              f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+
+def sample_vehicle_records(count):
+    """构造与 /api/last_locations 每条记录字段相同的模拟数据"""
+    records = []
+    for i in range(count):
+        records.append({
+            'id': i, 'license_plate': f"皖A{i:05d}", 'carId': str(100000 + i), 'vehicle_group': '一队',
+            'project_category': random.choice(['老城区环卫', '渣土项目', '新城区项目']),
+            'terminal_model': 'JT808', 'terminal_number': f"{13800000000 + i}",
+            'status': random.randint(0, 3), 'latitude': 31.8 + random.random() / 10,
+            'longitude': 117.2 + random.random() / 10, 'last_time': '2024-10-01 12:34:56',
+            'move_long': '1时23分45秒', 'move_long_num': random.randint(0, 36000),
+            'mile': round(random.random() * 300, 2), 'brand_model': '东风', 'vehicle_identification_number': f"LGAX{i:013d}",
+            'engine_number': f"E{i:08d}", 'owner': '合肥市环卫', 'vehicle_name': f"车辆{i}",
+            'gross_weight': Decimal('18.00'), 'vehicle_type': '压缩车', 'driver': '张三', 'driver_phone': '13800000000',
+            'car_no': f"NO{i}",
+        })
+    return records
+
+
+def to_columns(records):
+    fields = list(dict.fromkeys(field for record in records for field in record))
+    return {'count': len(records), 'fields': fields,
+            'columns': {field: [record.get(field) for record in records] for field in fields}}
+
+
+def bench_json(vehicles, repeat):
+    """对比标准库 json（Flask 默认参数）与 orjson、按行与按列格式的序列化耗时和响应体积"""
+    records = sample_vehicle_records(vehicles)
+
+    def stdlib_dumps(obj):
+        return json.dumps(obj, default=str, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    cases = [('stdlib rows', stdlib_dumps, lambda: records)]
+    if orjson is not None:
+        options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+        def orjson_dumps(obj):
+            return orjson.dumps(obj, default=str, option=options)
+
+        cases.append(('orjson rows', orjson_dumps, lambda: records))
+        cases.append(('orjson columns', orjson_dumps, lambda: to_columns(records)))
+    else:
+        print("未安装 orjson，只测试标准库 json。")
+    cases.append(('stdlib columns', stdlib_dumps, lambda: to_columns(records)))
+
+    print(f"车辆数: {vehicles}，重复次数: {repeat}")
+    for name, dumps, build in cases:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = dumps(build())
+            timings.append(time.perf_counter() - start)
+        print(f"{name:16s} 耗时 p50: {statistics.median(timings) * 1000:8.2f} ms，体积: {len(body) / 1024:8.1f} KB")
+
+
+def bench_gcj02(points, repeat):
+    """对比逐点与批量 WGS-84 -> GCJ-02 转换的吞吐量（点/秒），并检查两者结果一致"""
+    rng = np.random.default_rng(0)
+    # 大部分点在合肥附近，少量点在中国范围外
+    lngs = np.where(rng.random(points) < 0.95, rng.uniform(116.8, 117.6, points), rng.uniform(0, 72, points))
+    lats = rng.uniform(31.5, 32.2, points)
+    lng_list, lat_list = lngs.tolist(), lats.tolist()
+
+    scalar_timings, batch_timings = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scalar = [coords.wgs84_to_gcj02(lng, lat) for lng, lat in zip(lng_list, lat_list)]
+        scalar_timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        batch_lngs, batch_lats = coords.wgs84_to_gcj02_batch(lng_list, lat_list)
+        batch_timings.append(time.perf_counter() - start)
+
+    scalar = np.array(scalar)
+    max_error = max(np.abs(scalar[:, 0] - batch_lngs).max(), np.abs(scalar[:, 1] - batch_lats).max())
+    print(f"点数: {points}，重复次数: {repeat}，最大误差: {max_error:.3e}")
+    for name, timings in (('逐点', scalar_timings), ('批量', batch_timings)):
+        elapsed = statistics.median(timings)
+        print(f"{name} 耗时 p50: {elapsed * 1000:8.1f} ms，吞吐量: {points / elapsed:,.0f} 点/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cars_info 性能测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    api_parser = subparsers.add_parser('api', help='API 吞吐量（req/s）')
+    api_parser.add_argument('--url', required=True)
+    api_parser.add_argument('--concurrency', type=int, default=50)
+    api_parser.add_argument('--duration', type=float, default=30)
+
+    json_parser = subparsers.add_parser('json', help='JSON 序列化耗时与响应体积')
+    json_parser.add_argument('--vehicles', type=int, default=5000)
+    json_parser.add_argument('--repeat', type=int, default=20)
+
+    gcj02_parser = subparsers.add_parser('gcj02', help='WGS-84 -> GCJ-02 坐标转换吞吐量（点/秒）')
+    gcj02_parser.add_argument('--points', type=int, default=200000)
+    gcj02_parser.add_argument('--repeat', type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == 'api':
+        asyncio.run(bench_api(args.url, args.concurrency, args.duration))
+    elif args.command == 'json':
+        bench_json(args.vehicles, args.repeat)
+    elif args.command == 'gcj02':
+        bench_gcj02(args.points, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
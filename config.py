@@ -17,6 +17,14 @@ DB_CONFIG = {
     # 'charset': 'utf8mb4'
 }
 
+# API 进程共享的异步数据库连接池配置
+DB_POOL_CONFIG = {
+    'minsize': 2,
+    'maxsize': 20,
+    'pool_recycle': 3600,  # 连接最长复用时间（秒）
+    'ping_interval': 30,   # 连接空闲超过该秒数时先 ping 检查
+}
+
 # 定义API的Session IDs
 SESSION_ID_OLD_URBAN = "sNRkJpZXYwF2dmdmdmgCQmNlYIN3S1Nnawhic3kWNPNjZ5JWYeFWepZCZxpnch9VYf1mYmVmdkFXby9FRfNFNvJDawEXeY"
 SESSION_ID_NEW_URBAN = "5d5a059f-3435-423a-90e4-1c5876388d37-76180731"
@@ -36,3 +44,74 @@ LOG_FILE_DAILY = 'daily_data_track.log'
 
 # 定义异步请求的最大并发数
 MAX_CONCURRENT_REQUESTS = 10
+
+# 轨迹简化缓存：缓存条数、当天轨迹的缓存秒数、按缩放级别简化时允许的像素误差
+TRACK_CACHE_SIZE = 512
+TRACK_CACHE_TODAY_TTL = 60
+TRACK_SIMPLIFY_PIXEL_TOLERANCE = 1.0
+
+# 多进程共享缓存：backend 可选 'file'（本机目录）或 'redis'（需安装 redis 包）
+SHARED_CACHE_CONFIG = {
+    'backend': 'file',
+    'directory': '/tmp/cars_info_cache',
+    'redis_url': 'redis://localhost:6379/0',
+}
+
+# 位置推送：检查是否有新入库数据的间隔（秒）、每个订阅者最多积压的消息数
+FEED_POLL_INTERVAL = 2
+FEED_SUBSCRIBER_QUEUE_SIZE = 100
+# 每个 worker 进程最多同时保持的推送连接数，超出时返回 503
+FEED_MAX_SUBSCRIBERS = 1000
+
+# 生产环境 API 服务（asgi.py）监听地址与 worker 进程数
+API_SERVER = {
+    'host': '0.0.0.0',
+    'port': 8011,
+    'workers': 4,   # worker 进程数
+    'threads': 32,  # 每个 worker 中执行 Flask 视图的线程数
+}
+
+# 上游 HTTP 客户端（视频地址、登录等）：连接数上限、keep-alive 秒数、请求超时秒数
+UPSTREAM_HTTP_CONFIG = {
+    'limit': 100,
+    'limit_per_host': 30,
+    'keepalive_timeout': 60,
+    'timeout': 15,
+}
+
+# 视频地址缓存秒数（同一车辆的并发请求只调用一次上游）
+VIDEO_URL_CACHE_TTL = 30
+
+# 视频平台登录 jsession 的缓存秒数，以及过期前多少秒开始在后台提前刷新
+SESSID_CACHE_TTL = 1800
+SESSID_REFRESH_AHEAD = 300
+
+# 按需刷新单个车辆（人员）轨迹：同一车牌在 debounce 秒内的请求合并为一次，
+# workers 为执行刷新的线程数，status_ttl 为刷新状态的保留秒数
+REFRESH_QUEUE_CONFIG = {
+    'debounce': 15,
+    'workers': 4,
+    'status_ttl': 300,
+}
+
+# 轨迹拉取时每个上游接口的最大并发请求数（各接口使用独立的线程池，互不占用）
+PROVIDER_CONCURRENCY = {
+    'old': 8,                 # 老城区环卫旧接口
+    'new': 8,                 # 渣土项目等使用的新接口
+    'new_urban_project': 8,   # 新城区项目接口（车辆与人员）
+}
+
+# 轨迹入库时每个事务包含的车辆（人员）数；一块写入失败时逐个车辆重试，单个车辆的坏数据不影响其他车辆
+TRACK_STORE_CHUNK_SIZE = 200
+
+# 轨迹拉取断点：
+#   grace：从上次拉取的结束时间往前重叠的秒数，容纳上游延迟上报的点；
+#   chunk_hours：每次请求最多拉取的时长，长时间中断后分段补齐；
+#   initial_hours：没有任何断点和轨迹的车辆首次拉取的时长；
+#   max_backfill_days：最多补齐的天数（与轨迹保留期一致）
+INGEST_CHECKPOINT_CONFIG = {
+    'grace': 300,
+    'chunk_hours': 24,
+    'initial_hours': 24,
+    'max_backfill_days': 90,
+}
@@ -0,0 +1,102 @@
+# coords.py
+#
+# WGS-84 -> GCJ-02（火星坐标）转换。标量函数逐点计算；*_batch 函数用 NumPy 一次转换整批坐标，
+# 公式与运算顺序与标量版本相同，结果差异在 1e-9 以内。
+
+import math
+import numpy as np
+
+# 中国范围（经纬度），范围外的坐标不做偏移
+CHINA_LNG_MIN, CHINA_LNG_MAX = 72.004, 137.8347
+CHINA_LAT_MIN, CHINA_LAT_MAX = 0.8293, 55.8271
+
+EE = 0.00669342162296594323
+A_MAGIC = 6335552.717000426
+A = 6378137.0
+
+
+def out_of_china(lng, lat):
+    if lng < CHINA_LNG_MIN or lng > CHINA_LNG_MAX:
+        return True
+    if lat < CHINA_LAT_MIN or lat > CHINA_LAT_MAX:
+        return True
+    return False
+
+
+# 转换纬度
+def transform_lat(lng, lat):
+    ret = -100.0 + 2.0 * lng + 3.0 * lat + 0.2 * lat * lat + 0.1 * lng * lat + 0.2 * math.sqrt(abs(lng))
+    ret += (20.0 * math.sin(6.0 * lng * math.pi) + 20.0 * math.sin(2.0 * lng * math.pi)) * 2.0 / 3.0
+    ret += (20.0 * math.sin(lat * math.pi) + 40.0 * math.sin(lat / 3.0 * math.pi)) * 2.0 / 3.0
+    ret += (160.0 * math.sin(lat / 12.0 * math.pi) + 320 * math.sin(lat * math.pi / 30.0)) * 2.0 / 3.0
+    return ret
+
+
+# 转换经度
+def transform_lng(lng, lat):
+    ret = 300.0 + lng + 2.0 * lat + 0.1 * lng * lng + 0.1 * lng * lat + 0.1 * math.sqrt(abs(lng))
+    ret += (20.0 * math.sin(6.0 * lng * math.pi) + 20.0 * math.sin(2.0 * lng * math.pi)) * 2.0 / 3.0
+    ret += (20.0 * math.sin(lng * math.pi) + 40.0 * math.sin(lng / 3.0 * math.pi)) * 2.0 / 3.0
+    ret += (150.0 * math.sin(lng / 12.0 * math.pi) + 300.0 * math.sin(lng / 30.0 * math.pi)) * 2.0 / 3.0
+    return ret
+
+
+# WGS-84 转 GCJ-02
+def wgs84_to_gcj02(lng, lat):
+    if out_of_china(lng, lat):
+        return lng, lat
+    dlat = transform_lat(lng - 105.0, lat - 35.0)
+    dlng = transform_lng(lng - 105.0, lat - 35.0)
+    radlat = lat / 180.0 * math.pi
+    magic = math.sin(radlat)
+    magic = 1 - EE * magic * magic
+    sqrtmagic = math.sqrt(magic)
+    dlat = (dlat * 180.0) / ((A_MAGIC * magic) / (magic * sqrtmagic) * math.pi)
+    dlng = (dlng * 180.0) / (A / sqrtmagic * math.cos(radlat) * math.pi)
+    mglat = lat + dlat
+    mglng = lng + dlng
+    return mglng, mglat
+
+
+def out_of_china_batch(lngs, lats):
+    """:return: 布尔数组，True 表示坐标在中国范围外"""
+    return (lngs < CHINA_LNG_MIN) | (lngs > CHINA_LNG_MAX) | (lats < CHINA_LAT_MIN) | (lats > CHINA_LAT_MAX)
+
+
+def transform_lat_batch(lng, lat):
+    ret = -100.0 + 2.0 * lng + 3.0 * lat + 0.2 * lat * lat + 0.1 * lng * lat + 0.2 * np.sqrt(np.abs(lng))
+    ret += (20.0 * np.sin(6.0 * lng * math.pi) + 20.0 * np.sin(2.0 * lng * math.pi)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(lat * math.pi) + 40.0 * np.sin(lat / 3.0 * math.pi)) * 2.0 / 3.0
+    ret += (160.0 * np.sin(lat / 12.0 * math.pi) + 320 * np.sin(lat * math.pi / 30.0)) * 2.0 / 3.0
+    return ret
+
+
+def transform_lng_batch(lng, lat):
+    ret = 300.0 + lng + 2.0 * lat + 0.1 * lng * lng + 0.1 * lng * lat + 0.1 * np.sqrt(np.abs(lng))
+    ret += (20.0 * np.sin(6.0 * lng * math.pi) + 20.0 * np.sin(2.0 * lng * math.pi)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(lng * math.pi) + 40.0 * np.sin(lng / 3.0 * math.pi)) * 2.0 / 3.0
+    ret += (150.0 * np.sin(lng / 12.0 * math.pi) + 300.0 * np.sin(lng / 30.0 * math.pi)) * 2.0 / 3.0
+    return ret
+
+
+def wgs84_to_gcj02_batch(lngs, lats):
+    """
+    批量 WGS-84 转 GCJ-02。
+
+    :param lngs: 经度序列。
+    :param lats: 纬度序列。
+    :return: (GCJ-02 经度数组, GCJ-02 纬度数组)；中国范围外的点原样返回。
+    """
+    lngs = np.asarray(lngs, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    dlat = transform_lat_batch(lngs - 105.0, lats - 35.0)
+    dlng = transform_lng_batch(lngs - 105.0, lats - 35.0)
+    radlat = lats / 180.0 * math.pi
+    magic = np.sin(radlat)
+    magic = 1 - EE * magic * magic
+    sqrtmagic = np.sqrt(magic)
+    dlat = (dlat * 180.0) / ((A_MAGIC * magic) / (magic * sqrtmagic) * math.pi)
+    dlng = (dlng * 180.0) / (A / sqrtmagic * np.cos(radlat) * math.pi)
+
+    outside = out_of_china_batch(lngs, lats)
+    return np.where(outside, lngs, lngs + dlng), np.where(outside, lats, lats + dlat)
@@ -0,0 +1,219 @@
+# daily_rollups.py
+#
+# vehicle_daily_data 的按周（ISO 周，周一开始）/按月预汇总表。
+# 每日数据写入时由 DailyDataTracker.insert_daily_data 在同一事务中重新计算受影响的周、月；
+# /api/historical_data 的统计查询用“整月 + 整周 + 剩余天数”覆盖查询区间，减少需要求和的行数。
+# 每日明细的分页查询（load_historical_daily_page）也在这里。
+
+from datetime import timedelta
+from track_queries import historical_vehicles_page, historical_days
+
+# 预汇总类型 -> (表名, 周期起始日列名, 由 date 计算周期起始日的 SQL 表达式)
+ROLLUPS = {
+    'week': ('vehicle_weekly_data', 'week_start', "DATE_SUB(date, INTERVAL WEEKDAY(date) DAY)"),
+    'month': ('vehicle_monthly_data', 'month_start', "DATE_SUB(date, INTERVAL DAYOFMONTH(date) - 1 DAY)"),
+}
+
+ROLLUP_COLUMNS = ('running_mileage', 'driving_duration', 'parking_duration', 'engine_off_duration')
+
+
+def bucket_start(kind, day):
+    """某天所在周（周一）或月（1 日）的第一天"""
+    if kind == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def bucket_end(kind, start):
+    """周期的下一个周期起始日（半开区间的右端）"""
+    if kind == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def plan_range(start_date, end_date):
+    """
+    用最少的预汇总行覆盖闭区间 [start_date, end_date]：先取完整的自然月，
+    剩余部分再取完整的 ISO 周，最后剩下的按天查询 vehicle_daily_data。
+
+    :return: (month_starts, week_starts, day_ranges)，day_ranges 为 [(起始日, 结束日)] 闭区间列表。
+    """
+    month_starts = []
+    month = start_date if start_date.day == 1 else bucket_end('month', bucket_start('month', start_date))
+    while bucket_end('month', month) - timedelta(days=1) <= end_date:
+        month_starts.append(month)
+        month = bucket_end('month', month)
+
+    if month_starts:
+        segments = [(start_date, month_starts[0] - timedelta(days=1)),
+                    (bucket_end('month', month_starts[-1]), end_date)]
+    else:
+        segments = [(start_date, end_date)]
+
+    week_starts = []
+    day_ranges = []
+    for segment_start, segment_end in segments:
+        if segment_start > segment_end:
+            continue
+        weeks = []
+        week = segment_start + timedelta(days=(7 - segment_start.weekday()) % 7)
+        while week + timedelta(days=6) <= segment_end:
+            weeks.append(week)
+            week += timedelta(days=7)
+
+        if not weeks:
+            day_ranges.append((segment_start, segment_end))
+            continue
+        week_starts.extend(weeks)
+        if segment_start < weeks[0]:
+            day_ranges.append((segment_start, weeks[0] - timedelta(days=1)))
+        if weeks[-1] + timedelta(days=7) <= segment_end:
+            day_ranges.append((weeks[-1] + timedelta(days=7), segment_end))
+
+    return month_starts, week_starts, day_ranges
+
+
+def refresh_query(kind, first_day, last_day, vehicle_ids=None):
+    """
+    重新计算 [first_day, last_day] 所在的全部周期的预汇总（查询区间会扩展到周期边界）。
+    同步（pymysql）和异步（aiomysql）游标都可以直接执行。
+
+    :param vehicle_ids: 只重算这些车辆，None 表示全部车辆（迁移时回填）。
+    :return: (query, params)。
+    """
+    table, start_column, start_expression = ROLLUPS[kind]
+    range_start = bucket_start(kind, first_day)
+    range_end = bucket_end(kind, bucket_start(kind, last_day))
+
+    vehicle_filter = ''
+    params = [range_start, range_end]
+    if vehicle_ids is not None:
+        vehicle_filter = f"AND vehicle_id IN ({','.join(['%s'] * len(vehicle_ids))})"
+        params.extend(vehicle_ids)
+
+    sums = ', '.join(f"SUM({column}) AS {column}" for column in ROLLUP_COLUMNS)
+    updates = ', '.join(f"{column} = new.{column}" for column in ROLLUP_COLUMNS + ('day_count',))
+    query = f"""
+        INSERT INTO {table} (vehicle_id, {start_column}, {', '.join(ROLLUP_COLUMNS)}, day_count)
+        SELECT * FROM (
+            SELECT vehicle_id, {start_expression} AS {start_column}, {sums}, COUNT(*) AS day_count
+            FROM vehicle_daily_data
+            WHERE date >= %s AND date < %s {vehicle_filter}
+            GROUP BY vehicle_id, {start_column}
+        ) AS new
+        ON DUPLICATE KEY UPDATE {updates}
+    """
+    return query, params
+
+
+def refresh_queries_for_rows(daily_data):
+    """
+    insert_daily_data 写入的行所影响的周、月预汇总的重算语句。
+
+    :param daily_data: [(vehicle_id, license_plate, date, ...)]。
+    :return: [(query, params)]。
+    """
+    if not daily_data:
+        return []
+    vehicle_ids = sorted({row[0] for row in daily_data}, key=str)
+    dates = [row[2] for row in daily_data]
+    first_day, last_day = min(dates), max(dates)
+    return [refresh_query(kind, first_day, last_day, vehicle_ids) for kind in ROLLUPS]
+
+
+def aggregate_by_vehicle_info(start_date, end_date, companies):
+    """
+    /api/historical_data 的统计查询：按车辆信息分组求区间内的里程和时长。
+    与直接对 vehicle_daily_data 求和的结果一致，只是整月、整周的部分改为读取预汇总表。
+
+    :return: (query, params)。
+    """
+    month_starts, week_starts, day_ranges = plan_range(start_date, end_date)
+    company_placeholders = ','.join(['%s'] * len(companies))
+    vehicle_filter = f"vehicle_id IN (SELECT id FROM vehicleinfo WHERE project_category IN ({company_placeholders}))"
+    columns = ', '.join(ROLLUP_COLUMNS)
+
+    branches = []
+    params = []
+    for kind, starts in (('month', month_starts), ('week', week_starts)):
+        if not starts:
+            continue
+        table, start_column, _ = ROLLUPS[kind]
+        branches.append(f"""
+            SELECT vehicle_id, {columns} FROM {table}
+            WHERE {start_column} IN ({','.join(['%s'] * len(starts))}) AND {vehicle_filter}
+        """)
+        params.extend(starts)
+        params.extend(companies)
+    for range_start, range_end in day_ranges:
+        branches.append(f"""
+            SELECT vehicle_id, {columns} FROM vehicle_daily_data
+            WHERE date BETWEEN %s AND %s AND {vehicle_filter}
+        """)
+        params.extend((range_start, range_end))
+        params.extend(companies)
+
+    query = f"""
+        SELECT
+            vi.license_plate,
+            vi.project_category,
+            vi.driver,
+            vi.driver_phone,
+            vi.vehicle_type,
+            vi.vehicle_name,
+            COALESCE(SUM(r.running_mileage), 0) AS total_running_mileage,
+            COALESCE(SUM(r.driving_duration), 0) AS total_driving_duration,
+            COALESCE(SUM(r.parking_duration), 0) AS total_parking_duration,
+            COALESCE(SUM(r.engine_off_duration), 0) AS total_engine_off_duration
+        FROM vehicleinfo vi
+        LEFT JOIN ({' UNION ALL '.join(branches)}) r
+            ON vi.id = r.vehicle_id
+        WHERE vi.project_category IN ({company_placeholders})
+        GROUP BY vi.license_plate, vi.project_category, vi.driver, vi.driver_phone, vi.vehicle_type, vi.vehicle_name
+        ORDER BY vi.license_plate, vi.project_category
+    """
+    params.extend(companies)
+    return query, params
+
+
+async def load_historical_daily_page(fetchall, start_date, end_date, companies, license_plates, after, limit):
+    """
+    /api/historical_data 每日数据的一页，行格式与 api.historical_daily_query 相同，按 (车牌, 车辆ID, 日期) 排序。
+
+    先按 (车牌, 车辆ID) 键集分页取出车辆，再按 (vehicle_id, date) 索引分批读取这些车辆的日期，读够 limit 行即停止。
+    除上一页停在的车辆外每个车辆至少一行，因此最多需要 limit 个新车辆；有 after 时多取一个，
+    上一页停在的车辆已经没有剩余日期时也能凑满一页，调用方才能据此判断是否还有下一页。
+    每批的车辆数从 limit / 区间天数开始逐批翻倍，每页读取的行数约为 limit 加一个车辆的区间天数，与总行数无关。
+
+    :param fetchall: 执行查询的协程函数 fetchall(query, params)（db_pool.fetchall）。
+    :param after: 上一页最后一行的 (license_plate, vehicle_info_id, date)，None 表示第一页。
+    :return: 最多 limit 行。
+    """
+    vehicle_limit = limit + 1 if after else limit
+    vehicles = await fetchall(*historical_vehicles_page(
+        companies, license_plates, after=after[:2] if after else None, limit=vehicle_limit))
+
+    rows = []
+    batch_size = max(1, -(-limit // ((end_date - start_date).days + 1)))
+    i = 0
+    while i < len(vehicles) and len(rows) < limit:
+        batch = vehicles[i:i + batch_size]
+        i += batch_size
+        batch_size *= 2
+
+        days = {}
+        for day in await fetchall(*historical_days([vehicle[0] for vehicle in batch], start_date, end_date)):
+            days.setdefault(day[0], []).append(day[1:])
+
+        for vehicle_info_id, license_plate, *info in batch:
+            vehicle_days = days.get(vehicle_info_id, [])
+            if after and (license_plate, vehicle_info_id) == (after[0], after[1]):
+                # 上一页停在这个车辆上：只返回上一页最后日期之后的行
+                if after[2] is None:
+                    continue
+                vehicle_days = [day for day in vehicle_days if day[0] > after[2]]
+            elif not vehicle_days:
+                vehicle_days = [(None, 0, 0, 0, 0)]
+            rows.extend((license_plate, *info, *day, vehicle_info_id) for day in vehicle_days)
+
+    return rows[:limit]
@@ -5,10 +5,12 @@ from vehicle_tracker import VehicleTracker
 from history_info import DailyDataTracker
 import logging
 from config import LOG_FILE_TRACKER, LOG_FILE_DAILY
+from migrations import migrate
 
 def start_vehicle_tracker():
     """启动 VehicleTracker"""
-    tracker = VehicleTracker(loop_interval=5)  # 设定循环间隔，例如每5分钟执行一次
+    # 围栏进出检测只在这个进程中运行，API 进程中的 VehicleTracker 不开启
+    tracker = VehicleTracker(loop_interval=5, detect_fences=True)  # 设定循环间隔，例如每5分钟执行一次
     tracker.start()
 
 def start_daily_data_tracker():
@@ -23,6 +25,13 @@ def main():
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
     logger = logging.getLogger(__name__)
+    # 启动前先应用数据库结构迁移（索引、最新位置表等）
+    try:
+        applied = migrate()
+        logger.info(f"数据库迁移完成，本次应用版本: {applied or '无'}")
+    except Exception as e:
+        logger.error(f"数据库迁移失败: {e}")
+
     logger.info("启动所有跟踪器...")
 
     # 创建线程
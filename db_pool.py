@@ -0,0 +1,206 @@
+# db_pool.py
+
+import asyncio
+import time
+import logging
+import aiomysql
+from config import DB_CONFIG, DB_POOL_CONFIG
+import worker_loop
+
+
+class AsyncDBPool:
+    """
+    进程内共享的 aiomysql 连接池。
+
+    aiomysql 的连接池绑定在创建它的事件循环上，因此连接池固定运行在本进程的常驻事件循环（worker_loop）中，
+    在其他事件循环中调用时，数据库操作会被提交到该循环执行。
+    """
+
+    def __init__(self, db_config, minsize=1, maxsize=10, pool_recycle=3600, ping_interval=30):
+        self.db_config = db_config
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.pool_recycle = pool_recycle
+        self.ping_interval = ping_interval  # 连接空闲超过该秒数，取出时先 ping 检查健康状态
+
+        self.logger = logging.getLogger(__name__)
+        self._loop = None
+        self._pool = None
+        self._pool_lock = None
+
+        # 连接池指标
+        self._acquire_count = 0
+        self._waiting = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._health_check_failures = 0
+
+    def _ensure_loop(self):
+        """返回连接池所在的事件循环，即本进程的常驻事件循环"""
+        if self._loop is None:
+            self._loop = worker_loop.get_loop()
+        return self._loop
+
+    async def _get_pool(self):
+        """在后台事件循环中懒加载连接池"""
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await aiomysql.create_pool(
+                    minsize=self.minsize,
+                    maxsize=self.maxsize,
+                    pool_recycle=self.pool_recycle,
+                    autocommit=True,
+                    **self.db_config
+                )
+                self.logger.info(f"数据库连接池已创建，minsize={self.minsize}，maxsize={self.maxsize}")
+        return self._pool
+
+    async def _run(self, coro):
+        """把协程提交到连接池所在的事件循环执行并等待结果"""
+        loop = self._ensure_loop()
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def _check_health(self, connection):
+        """连接空闲较久时先 ping，必要时自动重连"""
+        if self._loop.time() - connection.last_usage < self.ping_interval:
+            return
+        try:
+            await connection.ping(reconnect=True)
+        except Exception:
+            self._health_check_failures += 1
+            raise
+
+    async def _acquire(self):
+        """从连接池取出连接并记录等待指标"""
+        pool = await self._get_pool()
+
+        self._waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = await pool.acquire()
+        finally:
+            self._waiting -= 1
+        waited = time.perf_counter() - start
+        self._acquire_count += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        return pool, connection
+
+    async def _with_cursor(self, job):
+        pool, connection = await self._acquire()
+        try:
+            await self._check_health(connection)
+            async with connection.cursor() as cursor:
+                return await job(connection, cursor)
+        finally:
+            pool.release(connection)
+
+    async def _stream_batches(self, query, params, batch_size):
+        pool, connection = await self._acquire()
+        finished = False
+        try:
+            await self._check_health(connection)
+            cursor = await connection.cursor(aiomysql.SSCursor)
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            await cursor.close()
+            finished = True
+        finally:
+            if not finished:
+                # 中途停止（如客户端断开）时直接关闭连接，不再读取剩余结果
+                connection.close()
+            pool.release(connection)
+
+    async def fetchall(self, query, params=None):
+        """执行查询并返回全部结果"""
+        async def job(connection, cursor):
+            await cursor.execute(query, params)
+            return await cursor.fetchall()
+        return await self._run(self._with_cursor(job))
+
+    async def fetchone(self, query, params=None):
+        """执行查询并返回第一行结果"""
+        async def job(connection, cursor):
+            await cursor.execute(query, params)
+            return await cursor.fetchone()
+        return await self._run(self._with_cursor(job))
+
+    async def transaction(self, func):
+        """
+        在同一个连接的事务中执行 func(connection, cursor)，成功则提交，出错则回滚并抛出异常。
+
+        :param func: 接收 (connection, cursor) 的协程函数。
+        :return: func 的返回值。
+        """
+        async def job(connection, cursor):
+            await connection.begin()
+            try:
+                result = await func(connection, cursor)
+                await connection.commit()
+                return result
+            except Exception:
+                await connection.rollback()
+                raise
+        return await self._run(self._with_cursor(job))
+
+    def stream(self, query, params=None, batch_size=1000):
+        """
+        使用服务端游标（SSCursor）逐批读取查询结果，内存占用与结果集大小无关。
+        这是同步生成器，供 WSGI 线程中的流式响应使用，不能在常驻事件循环内调用。
+
+        :return: 每次产出最多 batch_size 行的列表。
+        """
+        batches = self._stream_batches(query, params, batch_size)
+
+        async def next_batch():
+            try:
+                return await batches.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        try:
+            while True:
+                rows = worker_loop.run(next_batch())
+                if rows is None:
+                    break
+                yield rows
+        finally:
+            worker_loop.run(batches.aclose())
+
+    def start_background(self, coro):
+        """在连接池所在的事件循环中启动一个常驻后台协程"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def stats(self):
+        """返回连接池指标：连接数、使用中连接数、等待时间等"""
+        pool = self._pool
+        size = pool.size if pool else 0
+        free = pool.freesize if pool else 0
+        return {
+            'minsize': self.minsize,
+            'maxsize': self.maxsize,
+            'size': size,
+            'in_use': size - free,
+            'free': free,
+            'waiting': self._waiting,
+            'acquire_count': self._acquire_count,
+            'avg_wait_ms': round(self._wait_total / self._acquire_count * 1000, 3) if self._acquire_count else 0.0,
+            'max_wait_ms': round(self._wait_max * 1000, 3),
+            'health_check_failures': self._health_check_failures,
+        }
+
+
+# 进程级共享连接池
+db_pool = AsyncDBPool(DB_CONFIG, **DB_POOL_CONFIG)
@@ -0,0 +1,228 @@
+# fence_store.py
+
+import re
+import asyncio
+import hashlib
+from datetime import datetime
+from db_pool import db_pool
+from shared_cache import shared_cache
+
+# 比较围栏坐标时保留的小数位数（约 1 厘米），避免浮点/DECIMAL 表示差异被误判为修改
+COORD_DECIMALS = 7
+
+# 旧格式（不带 ID）按顺序配对时允许的最大坐标偏差（度，约 50 米）；超过时视为不同的围栏，删除后新增
+LEGACY_MATCH_TOLERANCE = 0.0005
+
+# 自动生成的围栏名称，新围栏从已有的最大编号之后继续编号
+FENCE_NAME_PATTERN = re.compile(r'^围栏 (\d+)$')
+
+
+def normalize_points(points):
+    """把 [{'lat': .., 'lng': ..}] 转换为可比较的坐标元组"""
+    return tuple((round(float(p['lat']), COORD_DECIMALS), round(float(p['lng']), COORD_DECIMALS)) for p in points)
+
+
+def normalize_fence_id(fence_id):
+    """围栏 ID 统一为 int（JSON 中可能是字符串 "3"），无法转换时视为没有 ID"""
+    if fence_id is None or isinstance(fence_id, bool):
+        return None
+    try:
+        return int(fence_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_fences(fences):
+    """
+    解析前端提交的围栏列表，兼容两种格式：
+    点列表 [{'lat', 'lng'}, ...]，或带 ID 的 {'id': 围栏ID, 'points': [...]}。
+
+    :return: [(围栏ID或None, 坐标元组)]。
+    """
+    parsed = []
+    for fence in fences:
+        if isinstance(fence, dict):
+            parsed.append((normalize_fence_id(fence.get('id')), normalize_points(fence.get('points', []))))
+        else:
+            parsed.append((None, normalize_points(fence)))
+    return parsed
+
+
+def near_identical(a, b, tolerance=LEGACY_MATCH_TOLERANCE):
+    """两个围栏的点数相同且每个点的偏差都不超过 tolerance"""
+    return len(a) == len(b) and all(
+        abs(lat_a - lat_b) <= tolerance and abs(lng_a - lng_b) <= tolerance
+        for (lat_a, lng_a), (lat_b, lng_b) in zip(a, b)
+    )
+
+
+def next_fence_names(names, count):
+    """
+    为 count 个新围栏生成名称，编号接在已有 "围栏 N" 的最大编号之后，不与已有名称重复。
+
+    :param names: 库中已有的围栏名称。
+    """
+    numbers = [int(match.group(1)) for match in map(FENCE_NAME_PATTERN.match, filter(None, names)) if match]
+    start = max(numbers, default=0) + 1
+    return [f"围栏 {start + k}" for k in range(count)]
+
+
+def diff_fences(stored, incoming):
+    """
+    计算提交的围栏与库中围栏的差异，尽量保持围栏 ID 不变。
+    匹配顺序：显式 ID 相同 -> 坐标完全相同 -> 按顺序与形状几乎相同的剩余库中围栏配对；都匹配不上的才新增或删除。
+    按顺序配对只用于不带 ID 的旧格式，且只配对点数相同、偏差不超过 LEGACY_MATCH_TOLERANCE 的围栏（微调过的同一围栏）；
+    提交中只要有围栏带 ID，或形状差别较大，未匹配的库中围栏就删除、新围栏使用新 ID，
+    不会把已删除围栏的 ID（以及它的进出事件）交给另一个形状。
+
+    :param stored: {围栏ID: 坐标元组}，按 ID 顺序。
+    :param incoming: parse_fences() 的返回值。
+    :return: (assigned, added, changed, removed)：
+             assigned 为每个提交围栏对应的库中 ID（新增为 None），
+             added 为新增围栏在 incoming 中的下标，changed 为坐标变化的围栏 ID，removed 为要删除的围栏 ID。
+    """
+    unmatched = list(stored)
+    assigned = [None] * len(incoming)
+
+    for i, (fence_id, points) in enumerate(incoming):
+        if fence_id in unmatched:
+            assigned[i] = fence_id
+            unmatched.remove(fence_id)
+
+    for i, (fence_id, points) in enumerate(incoming):
+        if assigned[i] is None:
+            for stored_id in unmatched:
+                if stored[stored_id] == points:
+                    assigned[i] = stored_id
+                    unmatched.remove(stored_id)
+                    break
+
+    legacy = all(fence_id is None for fence_id, _ in incoming)
+    for i, (_, points) in enumerate(incoming):
+        if legacy and assigned[i] is None:
+            for stored_id in unmatched:
+                if near_identical(stored[stored_id], points):
+                    assigned[i] = stored_id
+                    unmatched.remove(stored_id)
+                    break
+
+    added = [i for i, fence_id in enumerate(assigned) if fence_id is None]
+    changed = [fence_id for fence_id, (_, points) in zip(assigned, incoming)
+               if fence_id is not None and stored[fence_id] != points]
+    return assigned, added, changed, unmatched
+
+
+async def save_fences(cursor, fences):
+    """
+    在当前事务中按差异保存围栏：只新增、修改、删除有变化的围栏，坐标点用多行插入批量写入。
+
+    :param cursor: aiomysql 游标，调用方负责事务提交或回滚。
+    :param fences: 前端提交的围栏列表。
+    :return: {'fence_ids', 'added', 'changed', 'removed'}。
+    """
+    # 锁定现有围栏，避免并发保存时基于过期数据计算差异
+    await cursor.execute("""
+        SELECT F.id, F.name, FP.latitude, FP.longitude
+        FROM Fences F
+        LEFT JOIN FencePoints FP ON F.id = FP.fence_id
+        ORDER BY F.id, FP.point_order
+        FOR UPDATE
+    """)
+    stored = {}
+    names = {}
+    for fence_id, name, lat, lng in await cursor.fetchall():
+        names[fence_id] = name
+        points = stored.setdefault(fence_id, [])
+        if lat is not None:
+            points.append({'lat': lat, 'lng': lng})
+    stored = {fence_id: normalize_points(points) for fence_id, points in stored.items()}
+
+    incoming = parse_fences(fences)
+    assigned, added, changed, removed = diff_fences(stored, incoming)
+
+    if removed or changed:
+        placeholders = ','.join(['%s'] * len(removed + changed))
+        await cursor.execute(f"DELETE FROM FencePoints WHERE fence_id IN ({placeholders})", (*removed, *changed))
+    if removed:
+        placeholders = ','.join(['%s'] * len(removed))
+        await cursor.execute(f"DELETE FROM Fences WHERE id IN ({placeholders})", tuple(removed))
+
+    for i, name in zip(added, next_fence_names(names.values(), len(added))):
+        await cursor.execute("INSERT INTO Fences (name, created_at) VALUES (%s, %s)", (name, datetime.now()))
+        assigned[i] = cursor.lastrowid
+
+    # 新增和修改的围栏一起批量写入坐标点
+    rewrite = set(changed) | {assigned[i] for i in added}
+    point_rows = [
+        (fence_id, lat, lng, j)
+        for fence_id, (_, points) in zip(assigned, incoming) if fence_id in rewrite
+        for j, (lat, lng) in enumerate(points)
+    ]
+    if point_rows:
+        await cursor.executemany("""
+            INSERT INTO FencePoints (fence_id, latitude, longitude, point_order)
+            VALUES (%s, %s, %s, %s)
+        """, point_rows)
+
+    return {'fence_ids': assigned, 'added': len(added), 'changed': len(changed), 'removed': len(removed)}
+
+
+class FenceSnapshot:
+    """
+    /api/get_fences 使用的围栏快照：整理好的围栏列表、序列化后的 JSON 和 ETag。
+
+    以共享缓存中 'fences' 命名空间的版本号为准，save_fence 提交后调用 shared_cache.invalidate('fences')，
+    各进程在下一次请求时发现版本变化才重新查询一次数据库；版本不变时直接返回内存中的快照。
+    """
+
+    def __init__(self):
+        self.version = None
+        self.fences = []
+        self.body = b'[]'
+        self.etag = None
+        self._lock = None
+
+    async def get(self, dumps):
+        """
+        :param dumps: 序列化函数（传入 app.json.dumps，与 jsonify 的输出保持一致）。
+        :return: 当前版本的快照（self）。
+        """
+        version = shared_cache.namespace_version('fences')
+        if version == self.version and self.etag is not None:
+            return self
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # 等待锁期间其他请求可能已经重建过
+            if version != self.version or self.etag is None:
+                await self._rebuild(version, dumps)
+        return self
+
+    async def _rebuild(self, version, dumps):
+        rows = await db_pool.fetchall("""
+            SELECT F.id, F.name, FP.latitude, FP.longitude, FP.point_order
+            FROM Fences F
+            JOIN FencePoints FP ON F.id = FP.fence_id
+            ORDER BY F.id, FP.point_order
+        """)
+
+        fences = []
+        current = None
+        for fence_id, name, lat, lng, point_order in rows:
+            if current is None or current['id'] != fence_id:
+                current = {'id': fence_id, 'name': name, 'points': []}
+                fences.append(current)
+            current['points'].append({'lat': lat, 'lng': lng, 'order': point_order})
+
+        body = dumps(fences)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        # ETag 只取决于内容，各进程对相同数据生成相同的 ETag
+        self.fences = fences
+        self.body = body
+        self.etag = hashlib.md5(body).hexdigest()
+        self.version = version
+
+
+fence_snapshot = FenceSnapshot()
@@ -0,0 +1,257 @@
+# geofence.py
+
+import queue
+import logging
+import threading
+import numpy as np
+
+# 网格索引的单元格大小（度），约 5 公里
+GRID_CELL_SIZE = 0.05
+
+
+def points_in_polygon(lats, lngs, poly_lats, poly_lngs):
+    """
+    射线法判断一批点是否在多边形内，对点向量化，逐条边循环。
+
+    :return: 与 lats 等长的布尔数组。
+    """
+    inside = np.zeros(len(lats), dtype=bool)
+    j = len(poly_lats) - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(len(poly_lats)):
+            yi, yj = poly_lats[i], poly_lats[j]
+            xi, xj = poly_lngs[i], poly_lngs[j]
+            crosses = (yi > lats) != (yj > lats)
+            x_cross = (xj - xi) * (lats - yi) / (yj - yi) + xi
+            inside ^= crosses & (lngs < x_cross)
+            j = i
+    return inside
+
+
+def cell_keys(lats, lngs):
+    """把坐标映射为网格单元编号"""
+    ix = np.floor(np.asarray(lngs) / GRID_CELL_SIZE).astype(np.int64)
+    iy = np.floor(np.asarray(lats) / GRID_CELL_SIZE).astype(np.int64)
+    return ix * 1000000 + iy
+
+
+class FenceIndex:
+    """围栏多边形的均匀网格索引：每个围栏登记到其外接矩形覆盖的所有单元格"""
+
+    def __init__(self, fences):
+        """:param fences: {围栏ID: [(lat, lng), ...]}"""
+        self.fence_ids = []
+        self.polygons = []
+        self.bboxes = []
+        self.grid = {}
+
+        for fence_id, points in fences.items():
+            if len(points) < 3:
+                continue
+            lats = np.array([p[0] for p in points], dtype=float)
+            lngs = np.array([p[1] for p in points], dtype=float)
+            k = len(self.fence_ids)
+            self.fence_ids.append(fence_id)
+            self.polygons.append((lats, lngs))
+            bbox = (lats.min(), lats.max(), lngs.min(), lngs.max())
+            self.bboxes.append(bbox)
+
+            ix_range = range(int(np.floor(bbox[2] / GRID_CELL_SIZE)), int(np.floor(bbox[3] / GRID_CELL_SIZE)) + 1)
+            iy_range = range(int(np.floor(bbox[0] / GRID_CELL_SIZE)), int(np.floor(bbox[1] / GRID_CELL_SIZE)) + 1)
+            for ix in ix_range:
+                for iy in iy_range:
+                    self.grid.setdefault(ix * 1000000 + iy, []).append(k)
+
+    def contains(self, lats, lngs):
+        """
+        判断每个点落在哪些围栏内。
+
+        :return: {围栏下标: 落在该围栏内的点下标数组}。
+        """
+        keys = cell_keys(lats, lngs)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_keys) + 1))
+
+        # 按单元格收集每个围栏的候选点
+        candidates = {}
+        for c, key in enumerate(unique_keys):
+            fence_list = self.grid.get(int(key))
+            if not fence_list:
+                continue
+            cell_points = order[bounds[c]:bounds[c + 1]]
+            for k in fence_list:
+                candidates.setdefault(k, []).append(cell_points)
+
+        hits = {}
+        for k, parts in candidates.items():
+            idx = np.concatenate(parts)
+            min_lat, max_lat, min_lng, max_lng = self.bboxes[k]
+            in_bbox = (lats[idx] >= min_lat) & (lats[idx] <= max_lat) & (lngs[idx] >= min_lng) & (lngs[idx] <= max_lng)
+            idx = idx[in_bbox]
+            if len(idx) == 0:
+                continue
+            poly_lats, poly_lngs = self.polygons[k]
+            idx = idx[points_in_polygon(lats[idx], lngs[idx], poly_lats, poly_lngs)]
+            if len(idx):
+                hits[k] = idx
+        return hits
+
+
+class GeofenceEngine:
+    """
+    围栏进出事件检测。
+
+    VehicleTracker 每次写入轨迹后调用 submit() 把这一批点交给后台线程，不阻塞跟踪循环；
+    后台线程按车辆、时间排序后批量判断点是否在围栏内，与每个车辆上一次的状态比较得出进入/离开事件，
+    写入 fence_events 表。围栏表发生变化（CHECKSUM 不同）时重新加载索引。
+    """
+
+    def __init__(self, pool, max_pending=100):
+        self.pool = pool
+        self.logger = logging.getLogger(__name__)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+        self.index = None
+        self._fence_checksum = None
+        self.inside = {}  # {围栏ID: 当前在围栏内的车辆ID集合}
+
+    def submit(self, rows):
+        """提交一批轨迹点（VehicleTracker 的 optimized_data），后台线程首次提交时启动"""
+        if not rows:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            self.logger.warning(f"围栏检测队列已满，丢弃 {len(rows)} 个轨迹点。")
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='GeofenceEngineThread', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            rows = self._queue.get()
+            # 合并积压的批次，一次处理
+            while True:
+                try:
+                    rows = rows + self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self.process(rows)
+            except Exception as e:
+                self.logger.error(f"围栏检测出错: {e}")
+
+    def process(self, rows):
+        connection = self.pool.connection()
+        cursor = connection.cursor()
+        try:
+            self.reload_if_changed(cursor)
+            events = self.detect_events(rows)
+            if events:
+                cursor.executemany("""
+                    INSERT INTO fence_events (fence_id, vehicle_id, event_type, event_time, latitude, longitude)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, events)
+                connection.commit()
+                self.logger.info(f"写入 {len(events)} 条围栏进出事件。")
+        finally:
+            cursor.close()
+            connection.close()
+
+    def reload_if_changed(self, cursor):
+        cursor.execute("CHECKSUM TABLE Fences, FencePoints")
+        checksum = tuple(row[1] for row in cursor.fetchall())
+        if self.index is not None and checksum == self._fence_checksum:
+            return
+
+        cursor.execute("""
+            SELECT F.id, FP.latitude, FP.longitude
+            FROM Fences F
+            JOIN FencePoints FP ON F.id = FP.fence_id
+            ORDER BY F.id, FP.point_order
+        """)
+        fences = {}
+        for fence_id, lat, lng in cursor.fetchall():
+            fences.setdefault(fence_id, []).append((float(lat), float(lng)))
+        self.index = FenceIndex(fences)
+        self._fence_checksum = checksum
+
+        # 从最近的事件恢复每个车辆所在的围栏
+        cursor.execute("""
+            SELECT e.fence_id, e.vehicle_id, e.event_type
+            FROM fence_events e
+            JOIN (
+                SELECT MAX(id) AS max_id
+                FROM fence_events
+                GROUP BY fence_id, vehicle_id
+            ) m ON e.id = m.max_id
+        """)
+        self.inside = {fence_id: set() for fence_id in self.index.fence_ids}
+        for fence_id, vehicle_id, event_type in cursor.fetchall():
+            if fence_id in self.inside and event_type == 'enter':
+                self.inside[fence_id].add(vehicle_id)
+        self.logger.info(f"已加载 {len(self.index.fence_ids)} 个围栏。")
+
+    def detect_events(self, rows):
+        """
+        :param rows: [{'vehicle_id', 'latitude', 'longitude', 'track_time'}]。
+        :return: [(fence_id, vehicle_id, event_type, event_time, latitude, longitude)]。
+        """
+        if not self.index or not self.index.fence_ids:
+            return []
+
+        rows = sorted(rows, key=lambda d: (str(d['vehicle_id']), d['track_time']))
+        vehicle_ids = [d['vehicle_id'] for d in rows]
+        lats = np.array([d['latitude'] for d in rows], dtype=float)
+        lngs = np.array([d['longitude'] for d in rows], dtype=float)
+
+        # 车辆编码：排序后相同车辆连续排列
+        starts = np.ones(len(rows), dtype=bool)
+        starts[1:] = [vehicle_ids[i] != vehicle_ids[i - 1] for i in range(1, len(rows))]
+        codes = np.cumsum(starts) - 1
+        code_vehicles = [vehicle_ids[i] for i in np.flatnonzero(starts)]
+        vehicle_codes = {vehicle_id: c for c, vehicle_id in enumerate(code_vehicles)}
+
+        hits = self.index.contains(lats, lngs)
+        events = []
+        for k, fence_id in enumerate(self.index.fence_ids):
+            inside_before = self.inside.setdefault(fence_id, set())
+            hit_idx = hits.get(k)
+            relevant = set(codes[hit_idx].tolist()) if hit_idx is not None else set()
+            relevant.update(vehicle_codes[v] for v in inside_before if v in vehicle_codes)
+            if not relevant:
+                continue
+
+            inside_now = np.zeros(len(rows), dtype=bool)
+            if hit_idx is not None:
+                inside_now[hit_idx] = True
+
+            idx = np.flatnonzero(np.isin(codes, list(relevant)))
+            seq = inside_now[idx]
+            seq_starts = starts[idx]
+            prev = np.empty_like(seq)
+            prev[1:] = seq[:-1]
+            prev[seq_starts] = [code_vehicles[c] in inside_before for c in codes[idx[seq_starts]]]
+
+            for p in np.flatnonzero(seq != prev):
+                d = rows[idx[p]]
+                events.append((fence_id, d['vehicle_id'], 'enter' if seq[p] else 'exit',
+                               d['track_time'], d['latitude'], d['longitude']))
+
+            # 以每个车辆本批最后一个点的状态更新当前状态
+            ends = np.append(np.flatnonzero(seq_starts)[1:] - 1, len(idx) - 1)
+            for e in ends:
+                vehicle_id = rows[idx[e]]['vehicle_id']
+                if seq[e]:
+                    inside_before.add(vehicle_id)
+                else:
+                    inside_before.discard(vehicle_id)
+
+        return events
@@ -1,6 +1,7 @@
 # daily_data_tracker.py
 
 import asyncio
+import time
 import aiomysql
 import aiohttp
 from datetime import datetime
@@ -8,6 +9,9 @@ import json
 import logging
 from config import DB_CONFIG, SESSION_ID_OLD_URBAN, SESSION_ID_NEW_URBAN, API_URLS, MAX_CONCURRENT_REQUESTS
 from session_manager import SessionManager
+from track_queries import vehicles_tracked_on_day, batched_values
+from shared_cache import shared_cache
+from daily_rollups import refresh_queries_for_rows
 
 class DailyDataTracker:
     def __init__(self, loop_interval=60):
@@ -259,11 +263,7 @@ class DailyDataTracker:
     async def fetch_vehicle_tracker(self, connection):
         """从数据库获取所有车辆信息"""
         async with connection.cursor() as cursor:
-            await cursor.execute("""
-                SELECT DISTINCT vehicle_id
-                FROM vehicletrack
-                WHERE DATE(track_time) = CURDATE();
-            """)
+            await cursor.execute(*vehicles_tracked_on_day(datetime.now().date()))
             vehicles = await cursor.fetchall()
         return [vehicle[0] for vehicle in vehicles]
 
@@ -272,13 +272,21 @@ class DailyDataTracker:
         if not daily_data:
             self.logger.info("No valid data to insert.")
             return
+        # 变化版本号（微秒时间戳），只有数据实际变化时才更新，供 API 增量查询使用；提交前再改为提交时的时间
+        version = time.time_ns() // 1000
         async with connection.cursor() as cursor:
             insert_query = """
                 INSERT INTO vehicle_daily_data 
-                    (vehicle_id, license_plate, date, running_mileage, driving_duration, parking_duration, engine_off_duration, current_status)
-                VALUES 
-                    (%s, %s, %s, %s, %s, %s, %s, %s) AS new
+                    (vehicle_id, license_plate, date, running_mileage, driving_duration, parking_duration, engine_off_duration, current_status, version)
+                VALUES {values} AS new
                 ON DUPLICATE KEY UPDATE
+                    version = IF(
+                        vehicle_daily_data.running_mileage <=> new.running_mileage
+                        AND vehicle_daily_data.driving_duration <=> new.driving_duration
+                        AND vehicle_daily_data.parking_duration <=> new.parking_duration
+                        AND vehicle_daily_data.engine_off_duration <=> new.engine_off_duration
+                        AND vehicle_daily_data.current_status <=> new.current_status,
+                        vehicle_daily_data.version, new.version),
                     running_mileage = new.running_mileage,
                     driving_duration = new.driving_duration,
                     parking_duration = new.parking_duration,
@@ -286,8 +294,22 @@ class DailyDataTracker:
                     current_status = new.current_status,
                     updated_at = CURRENT_TIMESTAMP
             """
-            await cursor.executemany(insert_query, daily_data)
+            # 带行别名的 upsert 不能被 executemany 合并为一条语句，自行拼成多行 VALUES
+            for values, params in batched_values([(*row, version) for row in daily_data]):
+                await cursor.execute(insert_query.format(values=values), params)
+            # 在同一事务中重算受影响的周、月预汇总
+            for query, params in refresh_queries_for_rows(daily_data):
+                await cursor.execute(query, params)
+            # 上面的写入耗时较长，提交前把本次写入的临时版本号改为当前时间，
+            # 否则版本号比提交时间早得多，增量查询的游标可能已经越过它
+            dates = sorted({row[2] for row in daily_data})
+            await cursor.execute(
+                f"UPDATE vehicle_daily_data SET version = %s "
+                f"WHERE date IN ({','.join(['%s'] * len(dates))}) AND version = %s",
+                (time.time_ns() // 1000, *dates, version)
+            )
         await connection.commit()
+        shared_cache.invalidate('daily')
         self.logger.info(f"Successfully inserted daily data for {len(daily_data)} vehicles.")
 
     async def process_person_data(self, vehicle_id, license_plate, count_data, status_data, today):
@@ -0,0 +1,55 @@
+# json_provider.py
+
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用 Flask 默认的标准库实现
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    使用 orjson 序列化 jsonify / app.json 的输出，速度比标准库 json 快数倍。
+
+    输出与 Flask 默认实现保持一致：键排序、date/datetime 转为 HTTP 日期、Decimal 转为字符串，
+    区别只是中文直接以 UTF-8 输出而不转义为 \\uXXXX（与前端解析结果相同，体积更小）。
+    调用方传入 orjson 不支持的参数（如 cls）时退回标准库实现。
+    """
+
+    OPTIONS = 0
+    if orjson is not None:
+        OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_bytes(self, obj, indent=False):
+        options = self.OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=self.default, option=options)
+
+    def dumps(self, obj, **kwargs):
+        indent = kwargs.pop('indent', None)
+        kwargs.pop('separators', None)
+        kwargs.pop('sort_keys', None)
+        kwargs.pop('ensure_ascii', None)
+        if kwargs or indent not in (None, 2):
+            kwargs.setdefault('default', self.default)
+            return json.dumps(obj, indent=indent, sort_keys=self.sort_keys, ensure_ascii=self.ensure_ascii, **kwargs)
+        return self.dumps_bytes(obj, indent=indent is not None).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent=indent) + b"\n", mimetype=self.mimetype)
+
+
+def install(app):
+    """有 orjson 时把 app 的 JSON 实现替换为 OrjsonProvider"""
+    if orjson is not None:
+        app.json_provider_class = OrjsonProvider
+        app.json = OrjsonProvider(app)
+    return app
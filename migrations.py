@@ -0,0 +1,383 @@
+# migrations.py
+
+import sys
+import logging
+from datetime import datetime, timedelta
+import pymysql
+from config import DB_CONFIG
+import track_queries
+import daily_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaCheckError(Exception):
+    """热点查询没有使用索引（EXPLAIN 显示全表扫描、filesort 或使用了错误的索引）"""
+
+
+def connect():
+    """建立用于迁移的同步数据库连接"""
+    return pymysql.connect(
+        host=DB_CONFIG.get('host', 'localhost'),
+        port=DB_CONFIG.get('port', 3306),
+        user=DB_CONFIG.get('user'),
+        password=DB_CONFIG.get('password'),
+        database=DB_CONFIG.get('db'),
+        autocommit=True
+    )
+
+
+def column_type(cursor, table, column, default):
+    """读取已有列的类型定义，用于新表与旧表保持一致"""
+    cursor.execute("""
+        SELECT COLUMN_TYPE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND LOWER(TABLE_NAME) = LOWER(%s) AND LOWER(COLUMN_NAME) = LOWER(%s)
+    """, (table, column))
+    row = cursor.fetchone()
+    return row[0] if row else default
+
+
+def index_exists(cursor, table, index_name):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND LOWER(TABLE_NAME) = LOWER(%s) AND INDEX_NAME = %s
+        LIMIT 1
+    """, (table, index_name))
+    return cursor.fetchone() is not None
+
+
+def add_index(cursor, table, index_name, columns, unique=False):
+    """创建索引（已存在则跳过），MySQL 不支持 CREATE INDEX IF NOT EXISTS"""
+    if index_exists(cursor, table, index_name):
+        logger.info(f"索引 {table}.{index_name} 已存在，跳过。")
+        return
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    cursor.execute(f"ALTER TABLE {table} ADD {kind} {index_name} {columns}")
+    logger.info(f"已创建索引 {table}.{index_name} {columns}")
+
+
+# ---------------------------------------------------------------------------
+# 迁移步骤：只能追加新版本，不要修改已发布的版本
+# ---------------------------------------------------------------------------
+
+def migration_1_hot_query_indexes(cursor):
+    """热点查询需要的联合索引"""
+    add_index(cursor, 'VehicleTrack', 'idx_vehicle_track_time', '(vehicle_id, track_time)')
+    add_index(cursor, 'vehicle_daily_data', 'idx_daily_date_vehicle', '(date, vehicle_id)')
+
+
+def migration_2_latest_position(cursor):
+    """每个车辆（或人员）的最新位置表，为空时从历史轨迹初始化一次"""
+    vehicle_id_type = column_type(cursor, 'VehicleTrack', 'vehicle_id', 'VARCHAR(64)')
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS vehicle_latest_position (
+            vehicle_id {vehicle_id_type} NOT NULL,
+            latitude DOUBLE,
+            longitude DOUBLE,
+            track_time DATETIME NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (vehicle_id)
+        )
+    """)
+    add_index(cursor, 'vehicle_latest_position', 'idx_latest_track_time', '(track_time)')
+
+    cursor.execute("SELECT COUNT(*) FROM vehicle_latest_position")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("""
+            INSERT IGNORE INTO vehicle_latest_position (vehicle_id, latitude, longitude, track_time)
+            SELECT vt.vehicle_id, vt.latitude, vt.longitude, vt.track_time
+            FROM VehicleTrack vt
+            JOIN (
+                SELECT vehicle_id, MAX(track_time) AS max_time
+                FROM VehicleTrack
+                GROUP BY vehicle_id
+            ) lt ON vt.vehicle_id = lt.vehicle_id AND vt.track_time = lt.max_time
+        """)
+        logger.info(f"已从历史轨迹初始化最新位置表，共 {cursor.rowcount} 条记录。")
+
+
+def column_exists(cursor, table, column):
+    return column_type(cursor, table, column, None) is not None
+
+
+def migration_3_change_versions(cursor):
+    """位置表和每日数据表的变化版本号，供 API 增量查询（since）和 ETag 使用"""
+    for table in ('vehicle_latest_position', 'vehicle_daily_data'):
+        if not column_exists(cursor, table, 'version'):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN version BIGINT NOT NULL DEFAULT 0")
+    add_index(cursor, 'vehicle_latest_position', 'idx_latest_version', '(version)')
+    add_index(cursor, 'vehicle_daily_data', 'idx_daily_date_version', '(date, version)')
+
+
+def migration_4_fence_events(cursor):
+    """围栏进出事件表，由 geofence.GeofenceEngine 写入"""
+    vehicle_id_type = column_type(cursor, 'VehicleTrack', 'vehicle_id', 'VARCHAR(64)')
+    fence_id_type = column_type(cursor, 'Fences', 'id', 'INT')
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS fence_events (
+            id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            fence_id {fence_id_type} NOT NULL,
+            vehicle_id {vehicle_id_type} NOT NULL,
+            event_type VARCHAR(8) NOT NULL,
+            event_time DATETIME NOT NULL,
+            latitude DOUBLE,
+            longitude DOUBLE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_fence_events_fence_vehicle (fence_id, vehicle_id),
+            INDEX idx_fence_events_vehicle_time (vehicle_id, event_time)
+        )
+    """)
+
+
+def rollup_mileage_type(cursor):
+    """
+    预汇总里程列的类型：每日里程为 DECIMAL 时保持相同小数位（求和结果与直接求和完全一致），
+    为浮点类型时使用 DOUBLE。
+    """
+    daily_type = column_type(cursor, 'vehicle_daily_data', 'running_mileage', 'double').lower()
+    if daily_type.startswith('decimal'):
+        scale = daily_type[daily_type.index('(') + 1:daily_type.index(')')].split(',')[1] if ',' in daily_type else '0'
+        return f"DECIMAL(30,{scale.strip()})"
+    return 'DOUBLE'
+
+
+def migration_5_daily_rollups(cursor):
+    """每日数据的按周、按月预汇总表，并从现有每日数据回填"""
+    vehicle_id_type = column_type(cursor, 'vehicle_daily_data', 'vehicle_id', 'VARCHAR(64)')
+    mileage_type = rollup_mileage_type(cursor)
+    for kind, (table, start_column, _) in daily_rollups.ROLLUPS.items():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                vehicle_id {vehicle_id_type} NOT NULL,
+                {start_column} DATE NOT NULL,
+                running_mileage {mileage_type},
+                driving_duration BIGINT,
+                parking_duration BIGINT,
+                engine_off_duration BIGINT,
+                day_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (vehicle_id, {start_column}),
+                INDEX idx_{kind}_start_vehicle ({start_column}, vehicle_id)
+            )
+        """)
+
+    cursor.execute("SELECT MIN(date), MAX(date) FROM vehicle_daily_data")
+    first_day, last_day = cursor.fetchone()
+    if first_day is not None:
+        for kind in daily_rollups.ROLLUPS:
+            cursor.execute(*daily_rollups.refresh_query(kind, first_day, last_day))
+            logger.info(f"已回填 {daily_rollups.ROLLUPS[kind][0]}，影响 {cursor.rowcount} 行。")
+
+
+def migration_6_ingest_checkpoints(cursor):
+    """轨迹拉取断点表：每个 (接口, 车辆/人员) 已拉取到的时间和最后一个已入库的轨迹点时间"""
+    entity_id_type = column_type(cursor, 'VehicleTrack', 'vehicle_id', 'VARCHAR(64)')
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            source VARCHAR(32) NOT NULL,
+            entity_id {entity_id_type} NOT NULL,
+            fetched_until DATETIME NOT NULL,
+            last_point_time DATETIME,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, entity_id),
+            INDEX idx_checkpoint_entity (entity_id)
+        )
+    """)
+
+
+def drop_index(cursor, table, index_name):
+    """删除索引（不存在则跳过）"""
+    if not index_exists(cursor, table, index_name):
+        return
+    cursor.execute(f"ALTER TABLE {table} DROP INDEX {index_name}")
+    logger.info(f"已删除索引 {table}.{index_name}")
+
+
+def migration_7_unique_vehicle_track(cursor):
+    """
+    VehicleTrack 去重并加唯一键 (vehicle_id, track_time)，写入改为遇到重复键不报错。
+    唯一键与 idx_vehicle_track_time 的列相同，原索引随之删除。
+
+    去重和加唯一键（或复制、换表）都在 LOCK TABLES 下进行：API 进程的即时刷新、跟踪器此时写入轨迹会等待解锁，
+    不会在去重之后又写入重复行导致加唯一键失败，也不会写入即将被删除的旧表而丢失。
+    """
+    if index_exists(cursor, 'VehicleTrack', 'uniq_vehicle_track_time'):
+        return
+
+    if column_exists(cursor, 'VehicleTrack', 'id'):
+        # 有自增主键时保留每组重复记录中 id 最小的一条；LOCK TABLES 下自连接的每个别名都要加锁
+        cursor.execute("LOCK TABLES VehicleTrack WRITE, VehicleTrack AS t1 WRITE, VehicleTrack AS t2 WRITE")
+        try:
+            cursor.execute("""
+                DELETE t1 FROM VehicleTrack t1
+                JOIN VehicleTrack t2
+                    ON t1.vehicle_id = t2.vehicle_id AND t1.track_time = t2.track_time AND t1.id > t2.id
+            """)
+            logger.info(f"已删除 VehicleTrack 中 {cursor.rowcount} 条重复轨迹。")
+            add_index(cursor, 'VehicleTrack', 'uniq_vehicle_track_time', '(vehicle_id, track_time)', unique=True)
+        finally:
+            cursor.execute("UNLOCK TABLES")
+    else:
+        # 没有主键无法区分重复行：复制到带唯一键的新表后替换原表
+        cursor.execute("DROP TABLE IF EXISTS VehicleTrack_dedup")
+        cursor.execute("CREATE TABLE VehicleTrack_dedup LIKE VehicleTrack")
+        add_index(cursor, 'VehicleTrack_dedup', 'uniq_vehicle_track_time', '(vehicle_id, track_time)', unique=True)
+        # 复制和换表之间不能有新的写入，否则写入旧表的行会随旧表一起删除
+        cursor.execute("LOCK TABLES VehicleTrack WRITE, VehicleTrack_dedup WRITE")
+        try:
+            cursor.execute("INSERT IGNORE INTO VehicleTrack_dedup SELECT * FROM VehicleTrack")
+            logger.info(f"已复制 {cursor.rowcount} 条不重复轨迹到新表。")
+            cursor.execute("RENAME TABLE VehicleTrack TO VehicleTrack_old, VehicleTrack_dedup TO VehicleTrack")
+        finally:
+            cursor.execute("UNLOCK TABLES")
+        cursor.execute("DROP TABLE VehicleTrack_old")
+
+    drop_index(cursor, 'VehicleTrack', 'idx_vehicle_track_time')
+
+
+def migration_8_vehicleinfo_plate_index(cursor):
+    """/api/historical_data 每日数据分页按 (车牌, 车辆ID) 键集分页取车辆"""
+    add_index(cursor, 'vehicleinfo', 'idx_vehicleinfo_plate_id', '(license_plate, id)')
+
+
+MIGRATIONS = [
+    (1, '热点查询联合索引', migration_1_hot_query_indexes),
+    (2, '车辆最新位置表', migration_2_latest_position),
+    (3, '变化版本号', migration_3_change_versions),
+    (4, '围栏进出事件表', migration_4_fence_events),
+    (5, '每日数据按周、按月预汇总', migration_5_daily_rollups),
+    (6, '轨迹拉取断点表', migration_6_ingest_checkpoints),
+    (7, '轨迹去重与唯一键', migration_7_unique_vehicle_track),
+    (8, '车辆信息车牌索引', migration_8_vehicleinfo_plate_index),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at DATETIME NOT NULL
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(connection=None):
+    """
+    按版本号顺序执行尚未应用的迁移。
+
+    :return: 本次新应用的版本号列表。
+    """
+    own_connection = connection is None
+    connection = connection or connect()
+    cursor = connection.cursor()
+    applied = []
+    try:
+        done = applied_versions(cursor)
+        for version, description, step in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info(f"执行迁移 {version}: {description}")
+            step(cursor)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                (version, description, datetime.now())
+            )
+            connection.commit()
+            applied.append(version)
+    finally:
+        cursor.close()
+        if own_connection:
+            connection.close()
+    return applied
+
+
+# ---------------------------------------------------------------------------
+# EXPLAIN 检查：热点查询在大表上不能退化为全表扫描
+# ---------------------------------------------------------------------------
+
+def hot_queries(cursor):
+    """返回 [(名称, 查询语句, 参数, 需要检查的表)]，参数取自库中真实数据"""
+    cursor.execute("SELECT vehicle_id, track_time FROM vehicle_latest_position ORDER BY track_time DESC LIMIT 1")
+    row = cursor.fetchone()
+    vehicle_id, day = (row[0], row[1].date()) if row else (0, datetime.now().date())
+    cursor.execute("SELECT id, license_plate, project_category FROM vehicleinfo LIMIT 1")
+    vehicle = cursor.fetchone() or (0, '', '')
+
+    return [
+        ('车辆单日轨迹', *track_queries.vehicle_day_tracks(vehicle_id, day), {'vehicletrack'}),
+        ('多车辆单日轨迹', *track_queries.vehicles_day_tracks([vehicle_id], day), {'vehicletrack'}),
+        ('车辆当天最后位置', *track_queries.latest_positions_on_day([vehicle_id], day), {'vehicle_latest_position'}),
+        # 只取主键 vehicle_id，idx_latest_track_time 是覆盖索引，当天大部分车辆都有轨迹时也不会全表扫描
+        ('当天有轨迹的车辆', *track_queries.vehicles_tracked_on_day(day), {'vehicle_latest_position'}),
+        ('车辆每日统计', *track_queries.daily_data_on_day([vehicle_id], day), {'vehicle_daily_data'}),
+        ('历史数据分页车辆', *track_queries.historical_vehicles_page([vehicle[2]], [vehicle[1]], (vehicle[1], vehicle[0]), 1001),
+         {'vehicleinfo'}),
+        ('历史数据分页日期', *track_queries.historical_days([vehicle[0]], day - timedelta(days=30), day),
+         {'vehicle_daily_data'}),
+    ]
+
+
+# 检查的表上热点查询必须使用的索引（表名小写）
+EXPECTED_KEYS = {
+    'vehicletrack': 'uniq_vehicle_track_time',
+}
+
+
+def check_hot_queries(connection=None):
+    """
+    对热点查询执行 EXPLAIN，若检查的表上出现全表扫描（type = ALL）、需要 filesort，
+    或没有使用 EXPECTED_KEYS 中指定的索引，则抛出 SchemaCheckError。
+
+    :return: 每个查询的 EXPLAIN 摘要列表。
+    """
+    own_connection = connection is None
+    connection = connection or connect()
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    report = []
+    failures = []
+    try:
+        plain_cursor = connection.cursor()
+        try:
+            queries = hot_queries(plain_cursor)
+        finally:
+            plain_cursor.close()
+
+        for name, query, params, checked_tables in queries:
+            cursor.execute("EXPLAIN " + query, params)
+            for plan in cursor.fetchall():
+                table = (plan.get('table') or '').lower()
+                entry = {'query': name, 'table': plan.get('table'), 'type': plan.get('type'), 'key': plan.get('key')}
+                report.append(entry)
+                if table not in checked_tables:
+                    continue
+                if plan.get('type') == 'ALL':
+                    failures.append({**entry, 'reason': '全表扫描'})
+                elif table in EXPECTED_KEYS and plan.get('key') != EXPECTED_KEYS[table]:
+                    failures.append({**entry, 'reason': f"未使用索引 {EXPECTED_KEYS[table]}"})
+                elif 'Using filesort' in (plan.get('Extra') or ''):
+                    failures.append({**entry, 'reason': '需要 filesort'})
+    finally:
+        cursor.close()
+        if own_connection:
+            connection.close()
+
+    if failures:
+        details = '; '.join(f"{f['query']}({f['table']}): {f['reason']}" for f in failures)
+        raise SchemaCheckError(f"以下热点查询没有正确使用索引: {details}")
+    return report
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    applied = migrate()
+    logger.info(f"迁移完成，本次应用版本: {applied or '无'}")
+    if '--check' in sys.argv:
+        for entry in check_hot_queries():
+            logger.info(f"{entry['query']}: table={entry['table']} type={entry['type']} key={entry['key']}")
+        logger.info("热点查询索引检查通过。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# position_feed.py
+
+import queue
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from config import FEED_POLL_INTERVAL, FEED_SUBSCRIBER_QUEUE_SIZE, FEED_MAX_SUBSCRIBERS
+from db_pool import db_pool
+from shared_cache import shared_cache
+
+
+class PositionFeed:
+    """
+    车辆（人员）位置与状态的变化推送。
+
+    每个进程只有一个轮询协程：跟踪器提交数据后会递增共享缓存中 'tracks' / 'daily' 命名空间的版本号，
+    轮询协程发现版本变化时才查询一次数据库，与内存快照比对出变化的车辆，再分发给所有订阅者。
+    因此数据库开销只与入库周期有关，与打开的浏览器数量无关。
+
+    订阅者有两种：WSGI 线程使用 subscribe() 得到的 queue.Queue；生产环境（asgi.py）的 SSE 连接
+    使用 subscribe_async() 得到的 asyncio.Queue，在事件循环上等待，不占用 WSGI 线程。
+    每个进程最多 max_subscribers 个订阅者，超出时 subscribe 返回 None。
+    """
+
+    # 按 updated_at 增量查询时向前多取的秒数，避免边界上的更新被漏掉；重复数据由快照比对过滤
+    OVERLAP_SECONDS = 2
+
+    def __init__(self, poll_interval=FEED_POLL_INTERVAL, queue_size=FEED_SUBSCRIBER_QUEUE_SIZE,
+                 max_subscribers=FEED_MAX_SUBSCRIBERS):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.logger = logging.getLogger(__name__)
+
+        self._state = {}
+        self._state_lock = threading.Lock()
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+        self._versions = None
+        self._last_polled_at = None
+        self._state_date = None
+
+    def start(self):
+        """启动轮询协程（只启动一次）"""
+        with self._start_lock:
+            if not self._started:
+                db_pool.start_background(self._run())
+                self._started = True
+
+    def subscribe(self):
+        """供 WSGI 线程阻塞读取的订阅队列，订阅者已满时返回 None"""
+        return self._add_subscriber(queue.Queue(maxsize=self.queue_size))
+
+    def subscribe_async(self):
+        """
+        供事件循环上的协程读取的订阅队列，订阅者已满时返回 None。
+        变化由轮询协程在连接池所在的事件循环上分发，只能在该事件循环上调用和读取。
+        """
+        return self._add_subscriber(asyncio.Queue(maxsize=self.queue_size))
+
+    def _add_subscriber(self, subscriber):
+        with self._subscribers_lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._subscribers_lock:
+            self._subscribers.discard(subscriber)
+
+    def snapshot(self, timeout=10):
+        """当前所有车辆（人员）的最新位置与状态"""
+        self._ready.wait(timeout)
+        with self._state_lock:
+            return list(self._state.values())
+
+    async def snapshot_async(self, timeout=10):
+        """snapshot() 的协程版本，等待首次加载时不阻塞事件循环"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not self._ready.is_set() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+        with self._state_lock:
+            return list(self._state.values())
+
+    def _publish(self, changes):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(changes)
+            except (queue.Full, asyncio.QueueFull):
+                # 消费过慢的订阅者直接断开，客户端重连后会重新收到完整快照
+                self.unsubscribe(subscriber)
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(None)
+                except (queue.Empty, queue.Full, asyncio.QueueEmpty, asyncio.QueueFull):
+                    pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self._poll()
+            except Exception as e:
+                self.logger.error(f"位置推送轮询出错: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _poll(self):
+        versions = (shared_cache.namespace_version('tracks'), shared_cache.namespace_version('daily'))
+        today = datetime.now().date()
+        if versions == self._versions and today == self._state_date:
+            return
+
+        now_row = await db_pool.fetchone("SELECT NOW()")
+        polled_at = now_row[0]
+
+        # 首次轮询或跨天时加载完整快照，否则只查询上次轮询之后更新过的行
+        full_reload = self._last_polled_at is None or today != self._state_date
+        since = datetime.min if full_reload else self._last_polled_at - timedelta(seconds=self.OVERLAP_SECONDS)
+
+        positions = await db_pool.fetchall("""
+            SELECT vehicle_id, latitude, longitude, track_time
+            FROM vehicle_latest_position
+            WHERE updated_at >= %s
+        """, (since,))
+        statuses = await db_pool.fetchall("""
+            SELECT vehicle_id, current_status
+            FROM vehicle_daily_data
+            WHERE date = %s AND updated_at >= %s
+        """, (today, since))
+
+        changes = self._apply(positions, statuses, reset=full_reload)
+        self._versions = versions
+        self._last_polled_at = polled_at
+        self._state_date = today
+        self._ready.set()
+
+        if changes and not full_reload:
+            self._publish(changes)
+
+    def _apply(self, positions, statuses, reset=False):
+        """把查询结果合并进快照，返回发生变化的记录"""
+        changed = {}
+        with self._state_lock:
+            if reset:
+                self._state = {}
+
+            for vehicle_id, latitude, longitude, track_time in positions:
+                record = self._state.setdefault(vehicle_id, {
+                    'id': vehicle_id, 'latitude': None, 'longitude': None, 'last_time': None, 'status': 0
+                })
+                last_time = track_time.strftime('%Y-%m-%d %H:%M:%S') if track_time else None
+                if (record['latitude'], record['longitude'], record['last_time']) != (latitude, longitude, last_time):
+                    record.update(latitude=latitude, longitude=longitude, last_time=last_time)
+                    changed[vehicle_id] = record
+
+            for vehicle_id, current_status in statuses:
+                record = self._state.setdefault(vehicle_id, {
+                    'id': vehicle_id, 'latitude': None, 'longitude': None, 'last_time': None, 'status': 0
+                })
+                status = current_status if current_status and current_status > 0 else 0
+                if record['status'] != status:
+                    record['status'] = status
+                    changed[vehicle_id] = record
+
+            return [dict(record) for record in changed.values()]
+
+
+position_feed = PositionFeed()
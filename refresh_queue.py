@@ -0,0 +1,101 @@
+# refresh_queue.py
+
+import time
+import queue
+import logging
+import threading
+import itertools
+from config import REFRESH_QUEUE_CONFIG
+from shared_cache import shared_cache
+
+# 优先级数值越小越先执行
+PRIORITY_INTERACTIVE = 0
+
+
+class RefreshQueue:
+    """
+    按需刷新单个车辆（人员）轨迹的队列。
+
+    API 收到带 license_plate 的请求时不再等待上游接口和数据库写入，而是调用 request() 登记刷新后立即返回现有数据。
+    同一车牌在 debounce 秒内的请求（包括其他 worker 进程的请求）合并为一次刷新，共用同一个令牌；
+    刷新由本进程的专用线程执行，不排在跟踪器的定时全量拉取之后。
+    刷新写入后跟踪器会使 'tracks' 命名空间失效，SSE 订阅者（/api/last_locations/stream）随即收到新位置，
+    也可以用令牌查询 /api/refresh_status。
+    """
+
+    def __init__(self, handler, debounce=15, workers=4, status_ttl=300):
+        """
+        :param handler: 执行刷新的同步函数 handler(license_plate, person)，刷新成功时返回 True。
+        """
+        self.handler = handler
+        self.debounce = debounce
+        self.workers = workers
+        self.status_ttl = status_ttl
+        self.logger = logging.getLogger(__name__)
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._threads = []
+        self._threads_lock = threading.Lock()
+
+    def request(self, license_plate, person=False, priority=PRIORITY_INTERACTIVE):
+        """
+        登记一次刷新，已有相同车牌的刷新在 debounce 时间内时直接合并。
+
+        :return: 刷新令牌，可用 status() 查询进度。
+        """
+        lock_name = f"refresh:{'person' if person else 'vehicle'}:{license_plate}"
+        token = shared_cache.acquire_lock(lock_name, self.debounce)
+        if token is None:
+            existing = shared_cache.get(f"lock:{lock_name}")
+            if existing:
+                return existing
+            # 锁恰好过期，重新登记
+            token = shared_cache.acquire_lock(lock_name, self.debounce)
+            if token is None:
+                return shared_cache.get(f"lock:{lock_name}")
+
+        self._set_status(token, license_plate, 'pending')
+        self._ensure_workers()
+        self._queue.put((priority, next(self._sequence), token, license_plate, person))
+        return token
+
+    def status(self, token):
+        """:return: {'license_plate', 'state', 'requested_at', 'finished_at'}，令牌未知或已过期时返回 None"""
+        return shared_cache.get(f"refresh_status:{token}")
+
+    def _set_status(self, token, license_plate, state):
+        status = self.status(token) or {'license_plate': license_plate, 'requested_at': time.time(),
+                                        'finished_at': None}
+        status['state'] = state
+        if state in ('done', 'failed'):
+            status['finished_at'] = time.time()
+        shared_cache.set(f"refresh_status:{token}", status, self.status_ttl)
+
+    def _ensure_workers(self):
+        with self._threads_lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'RefreshWorker-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            priority, _, token, license_plate, person = self._queue.get()
+            self._set_status(token, license_plate, 'running')
+            try:
+                if self.handler(license_plate, person):
+                    self._set_status(token, license_plate, 'done')
+                    self.logger.info(f"已按需刷新车牌号 {license_plate} 的轨迹。")
+                else:
+                    self._set_status(token, license_plate, 'failed')
+                    self.logger.warning(f"按需刷新车牌号 {license_plate} 的轨迹失败。")
+            except Exception as e:
+                self._set_status(token, license_plate, 'failed')
+                self.logger.error(f"按需刷新车牌号 {license_plate} 的轨迹时出错: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def create_refresh_queue(handler):
+    return RefreshQueue(handler, **REFRESH_QUEUE_CONFIG)
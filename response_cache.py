@@ -0,0 +1,94 @@
+# response_cache.py
+
+import time
+import asyncio
+import hashlib
+import functools
+from urllib.parse import urlencode
+from flask import current_app, request
+from shared_cache import shared_cache
+
+# 随缓存条目保存的响应头
+CACHED_HEADERS = ('Content-Type', 'X-Cursor')
+
+
+def make_cache_key(namespaces, ignore_args=()):
+    """由请求路径、查询参数（排序后，去掉 ignore_args）和依赖的命名空间版本号组成缓存键"""
+    args = urlencode(sorted((name, value) for name, value in request.args.items(multi=True) if name not in ignore_args))
+    versions = ','.join(f"{ns}={shared_cache.namespace_version(ns)}" for ns in namespaces)
+    return f"resp:{request.path}?{args}|{versions}"
+
+
+def _to_response(entry):
+    response = current_app.response_class(entry['body'], status=entry['status'])
+    for name, value in entry['headers']:
+        response.headers[name] = value
+    response.headers['X-Cache'] = entry.get('cache_state', 'HIT')
+    if entry.get('etag'):
+        response.set_etag(entry['etag'])
+    return response
+
+
+def cached_response(ttl, stale_ttl=0, namespaces=(), bypass_args=(), ignore_args=(), lock_timeout=30, wait_timeout=10):
+    """
+    async 视图的共享响应缓存装饰器。
+
+    - 缓存新鲜期 ttl 秒；之后 stale_ttl 秒内仍返回旧响应，同时只由一个请求重建（stale-while-revalidate）。
+    - 没有可用缓存时只有一个请求执行视图，其余请求等待它的结果（single-flight）。
+    - namespaces 中任一命名空间被 shared_cache.invalidate() 后，缓存立即失效。
+    - 请求带有 bypass_args 中任一参数时不使用缓存。
+    - ignore_args 中的参数不影响响应内容，不计入缓存键。
+    - 缓存条目保存响应内容的 md5 作为 ETag，命中缓存时不必重新计算。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            if any(arg in request.args for arg in bypass_args):
+                return await view(*args, **kwargs)
+
+            key = make_cache_key(namespaces, ignore_args)
+            entry = shared_cache.get(key)
+            age = time.time() - entry['created'] if entry else None
+
+            if entry and age < ttl:
+                return _to_response(entry)
+
+            lock_token = shared_cache.acquire_lock(key, lock_timeout)
+            if not lock_token:
+                if entry:
+                    # 已有请求在重建，先返回旧响应
+                    return _to_response({**entry, 'cache_state': 'STALE'})
+
+                # 等待正在重建的请求写入缓存
+                deadline = time.monotonic() + wait_timeout
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    entry = shared_cache.get(key)
+                    if entry:
+                        return _to_response(entry)
+                    lock_token = shared_cache.acquire_lock(key, lock_timeout)
+                    if lock_token:
+                        break
+
+            try:
+                response = current_app.make_response(await view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    body = response.get_data()
+                    etag = hashlib.md5(body).hexdigest()
+                    shared_cache.set(key, {
+                        'body': body,
+                        'status': response.status_code,
+                        'headers': [(name, response.headers[name]) for name in CACHED_HEADERS
+                                    if name in response.headers],
+                        'etag': etag,
+                        'created': time.time(),
+                    }, ttl + stale_ttl)
+                    response.set_etag(etag)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            finally:
+                if lock_token:
+                    shared_cache.release_lock(key, lock_token)
+
+        return wrapper
+    return decorator
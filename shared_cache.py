@@ -0,0 +1,173 @@
+# shared_cache.py
+
+import os
+import time
+import uuid
+import pickle
+import random
+import hashlib
+import logging
+import tempfile
+from config import SHARED_CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class FileCacheBackend:
+    """
+    基于本地目录的缓存后端，同一台机器上的多个 worker 进程共享。
+    每个键一个文件，文件的 mtime 记录过期时间；写入先写临时文件再原子替换。
+    """
+
+    def __init__(self, directory, prune_probability=0.01):
+        self.directory = directory
+        self.prune_probability = prune_probability
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.stat(path).st_mtime < time.time():
+                return None
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value, ttl):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            expires_at = time.time() + ttl
+            os.utime(tmp_path, (expires_at, expires_at))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"写入缓存 {key} 时出错: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        if random.random() < self.prune_probability:
+            self.prune()
+
+    def add(self, key, value, ttl):
+        """键不存在（或已过期）时写入并返回 True，否则返回 False，用作跨进程锁"""
+        path = self._path(key)
+        try:
+            if os.stat(path).st_mtime < time.time():
+                os.unlink(path)
+        except OSError:
+            pass
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f)
+        expires_at = time.time() + ttl
+        os.utime(path, (expires_at, expires_at))
+        return True
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def prune(self):
+        """删除已过期的缓存文件"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < now:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+
+class RedisCacheBackend:
+    """Redis（或兼容 Redis 协议的本地服务）缓存后端，需要安装 redis 包"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        data = self.client.get(key)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), px=int(ttl * 1000))
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, pickle.dumps(value), px=int(ttl * 1000), nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class SharedCache:
+    """
+    多进程共享缓存：命名空间版本号 + 跨进程锁。
+    数据写入后调用 invalidate(命名空间) 递增版本号，键中带版本号的旧缓存随之失效。
+    """
+
+    # 命名空间版本号本身的保存时间，足够长即可
+    VERSION_TTL = 30 * 24 * 3600
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.error(f"读取缓存 {key} 时出错: {e}")
+            return None
+
+    def set(self, key, value, ttl):
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            logger.error(f"写入缓存 {key} 时出错: {e}")
+
+    def namespace_version(self, namespace):
+        return self.get(f"ns:{namespace}") or 0
+
+    def invalidate(self, *namespaces):
+        """使命名空间下的所有缓存失效；版本号使用时间戳，无需读-改-写"""
+        for namespace in namespaces:
+            self.set(f"ns:{namespace}", time.time_ns(), self.VERSION_TTL)
+
+    def acquire_lock(self, name, timeout):
+        """获取跨进程锁，成功返回令牌，失败返回 None；timeout 秒后锁自动失效"""
+        token = uuid.uuid4().hex
+        try:
+            return token if self.backend.add(f"lock:{name}", token, timeout) else None
+        except Exception as e:
+            logger.error(f"获取缓存锁 {name} 时出错: {e}")
+            return None
+
+    def release_lock(self, name, token):
+        key = f"lock:{name}"
+        if self.get(key) == token:
+            self.backend.delete(key)
+
+
+def create_backend(config):
+    if config.get('backend') == 'redis':
+        try:
+            return RedisCacheBackend(config['redis_url'])
+        except Exception as e:
+            logger.warning(f"Redis 缓存后端不可用，改用文件缓存: {e}")
+    return FileCacheBackend(config.get('directory', os.path.join(tempfile.gettempdir(), 'cars_info_cache')))
+
+
+# 进程内共享实例，API 与跟踪器使用同一配置即可共享缓存和失效信号
+shared_cache = SharedCache(create_backend(SHARED_CACHE_CONFIG))
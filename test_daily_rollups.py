@@ -0,0 +1,74 @@
+# test_daily_rollups.py
+
+import random
+import asyncio
+from datetime import date, timedelta
+from daily_rollups import load_historical_daily_page
+
+COMPANIES = ['渣土项目']
+
+
+class FakeDailyTables:
+    """按 historical_vehicles_page / historical_days 的参数在内存中模拟 vehicleinfo 和 vehicle_daily_data"""
+
+    def __init__(self, vehicles, days):
+        self.vehicles = vehicles  # [(id, license_plate)]
+        self.days = days  # {vehicle_id: [date]}
+
+    async def fetchall(self, query, params):
+        if 'FROM vehicleinfo' in query:
+            rows = sorted(self.vehicles, key=lambda v: (v[1], v[0]))
+            if 'id >=' in query:
+                after_plate, after_id = params[-4], params[-2]
+                rows = [v for v in rows if (v[1], v[0]) >= (after_plate, after_id)]
+            return [(vehicle_id, plate, COMPANIES[0], '司机', '电话', '类型', '名称')
+                    for vehicle_id, plate in rows[:params[-1]]]
+
+        *vehicle_ids, start_date, end_date = params
+        return [(vehicle_id, day, 1, 2, 3, 4) for vehicle_id in sorted(vehicle_ids)
+                for day in self.days.get(vehicle_id, []) if start_date <= day <= end_date]
+
+    def all_rows(self, start_date, end_date):
+        """一次性查询全部数据时应得到的结果"""
+        rows = []
+        for vehicle_id, plate in sorted(self.vehicles, key=lambda v: (v[1], v[0])):
+            info = (plate, COMPANIES[0], '司机', '电话', '类型', '名称')
+            days = [day for day in self.days.get(vehicle_id, []) if start_date <= day <= end_date]
+            if not days:
+                rows.append((*info, None, 0, 0, 0, 0, vehicle_id))
+            rows.extend((*info, day, 1, 2, 3, 4, vehicle_id) for day in days)
+        return rows
+
+
+def read_all_pages(tables, start_date, end_date, page_limit):
+    """像 /api/historical_data 一样逐页读取（每页多取一行判断是否还有下一页），直到没有下一页"""
+    plates = sorted({plate for _, plate in tables.vehicles})
+    rows = []
+    after = None
+    while True:
+        results = asyncio.run(load_historical_daily_page(tables.fetchall, start_date, end_date, COMPANIES, plates,
+                                                         after, page_limit + 1))
+        page = results[:page_limit]
+        rows.extend(page)
+        if len(results) <= page_limit:
+            return rows
+        after = (page[-1][0], page[-1][11], page[-1][6])
+
+
+def test_page_ending_on_last_day_of_vehicle_keeps_following_plates():
+    day = date(2024, 10, 1)
+    tables = FakeDailyTables([(i, f"P{i:03d}") for i in range(1, 26)], {i: [day] for i in range(1, 26)})
+    rows = read_all_pages(tables, day, day, page_limit=10)
+    assert [row[0] for row in rows] == [f"P{i:03d}" for i in range(1, 26)]
+
+
+def test_pages_match_full_query():
+    random.seed(7)
+    start_date, end_date = date(2024, 1, 1), date(2024, 1, 20)
+    # 包含车牌相同的车辆和区间内没有数据的车辆
+    vehicles = [(i, random.choice(['A1', 'A2', 'B1', 'B1', 'C9', 'D4'])) for i in range(1, 30)]
+    days = {vehicle_id: [start_date + timedelta(days=k) for k in range(20) if random.random() < 0.3]
+            for vehicle_id, _ in vehicles}
+    tables = FakeDailyTables(vehicles, days)
+    for page_limit in (1, 2, 3, 7, 10, 50):
+        assert read_all_pages(tables, start_date, end_date, page_limit) == tables.all_rows(start_date, end_date)
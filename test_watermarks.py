@@ -0,0 +1,65 @@
+# test_watermarks.py
+
+from datetime import datetime, timedelta
+from watermarks import fetch_window
+
+CONFIG = {'grace': 300, 'chunk_hours': 24, 'initial_hours': 24, 'max_backfill_days': 90}
+
+
+def sweep(now, checkpoint, same_month):
+    """模拟一轮拉取：计算窗口并像 collect()/CheckpointStore.advance() 一样前移断点（上游没有返回轨迹点）"""
+    start_time, end_time = fetch_window(checkpoint, None, now, same_month=same_month, config=CONFIG)
+    return start_time, end_time, (end_time, checkpoint[1] if checkpoint else None)
+
+
+def test_same_month_window_crosses_month_boundary():
+    checkpoint = (datetime(2026, 1, 31, 23, 50), None)
+    now = datetime(2026, 2, 1, 0, 3)
+
+    start_time, end_time, checkpoint = sweep(now, checkpoint, same_month=True)
+    assert (start_time, end_time) == (datetime(2026, 1, 31, 23, 45), datetime(2026, 1, 31, 23, 59, 59))
+
+    # 已拉取到月末，下一轮从下月 1 日开始，不会反复拉取上个月的最后几分钟
+    start_time, end_time, checkpoint = sweep(now + timedelta(minutes=5), checkpoint, same_month=True)
+    assert start_time == datetime(2026, 2, 1)
+    assert end_time == now + timedelta(minutes=5, seconds=1)
+
+    # 之后 grace 照常回退（同一个月内）
+    start_time, end_time, checkpoint = sweep(now + timedelta(minutes=10), checkpoint, same_month=True)
+    assert start_time == datetime(2026, 2, 1, 0, 3, 1)
+    assert end_time.month == 2
+
+    # 刚进入新月份时 grace 不会把开始时间退回上个月
+    checkpoint = (datetime(2026, 2, 1, 0, 1), None)
+    start_time, end_time, checkpoint = sweep(now, checkpoint, same_month=True)
+    assert start_time == datetime(2026, 2, 1)
+
+
+def test_same_month_window_with_last_point_and_year_end():
+    checkpoint = (datetime(2025, 12, 31, 23, 59, 59), datetime(2025, 12, 31, 23, 59, 30))
+    now = datetime(2026, 1, 1, 8)
+    start_time, end_time = fetch_window(checkpoint, None, now, same_month=True, config=CONFIG)
+    assert start_time == datetime(2026, 1, 1)
+    assert end_time == now + timedelta(seconds=1)
+
+
+def test_long_outage_catches_up_month_by_month():
+    checkpoint = (datetime(2026, 1, 30, 12), None)
+    now = datetime(2026, 2, 3, 12)
+    starts = []
+    for _ in range(10):
+        start_time, end_time, checkpoint = sweep(now, checkpoint, same_month=True)
+        starts.append(start_time)
+        assert (start_time.year, start_time.month) == (end_time.year, end_time.month)
+        if end_time >= now:
+            break
+    assert datetime(2026, 2, 1) in starts
+    assert end_time == now + timedelta(seconds=1)
+
+
+def test_window_without_same_month_keeps_grace():
+    checkpoint = (datetime(2026, 1, 31, 23, 59, 59), None)
+    now = datetime(2026, 2, 1, 0, 3)
+    start_time, end_time = fetch_window(checkpoint, None, now, config=CONFIG)
+    assert start_time == datetime(2026, 1, 31, 23, 54, 59)
+    assert end_time == now + timedelta(seconds=1)
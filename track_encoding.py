@@ -0,0 +1,81 @@
+# track_encoding.py
+
+import struct
+import numpy as np
+
+# 二进制轨迹格式：文件头 + 每个车辆一段记录，全部为小端序
+#   文件头: b'VTRK', 版本 uint8, 车辆数 uint32
+#   车辆记录: ID 长度 uint16, ID（UTF-8）, 点数 uint32, 起始时间 int64（Unix 秒）,
+#            纬度 int32[点数]（度 * 1e6）, 经度 int32[点数]（度 * 1e6）, 时间偏移 uint32[点数]（相对起始时间的秒数）
+BINARY_MAGIC = b'VTRK'
+BINARY_VERSION = 1
+BINARY_SCALE = 1000000
+
+
+def encode_values(values):
+    """
+    Google 编码折线算法：对整数差值做 zigzag + 5 bit 分组编码。
+
+    :param values: 已经是差值的整数序列。
+    :return: 编码后的 ASCII 字符串。
+    """
+    chunks = []
+    for value in values:
+        value = int(value)
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode_polyline(latitudes, longitudes, precision=5):
+    """把经纬度序列编码为 Google 编码折线字符串"""
+    factor = 10 ** precision
+    lat = np.round(np.asarray(latitudes, dtype=float) * factor).astype(np.int64)
+    lng = np.round(np.asarray(longitudes, dtype=float) * factor).astype(np.int64)
+
+    # 纬度、经度差值交替排列
+    deltas = np.empty(len(lat) * 2, dtype=np.int64)
+    deltas[0::2] = np.diff(lat, prepend=0)
+    deltas[1::2] = np.diff(lng, prepend=0)
+    return encode_values(deltas.tolist())
+
+
+def time_offsets(track_times):
+    """返回 (起始时间, 每个点相对起始时间的秒数数组)"""
+    seconds = np.array(track_times, dtype='datetime64[s]').astype(np.int64)
+    return track_times[0], seconds - seconds[0]
+
+
+def encode_track_polyline(vehicle_id, latitudes, longitudes, track_times, precision=5):
+    """单个车辆的折线编码结果；时间用相邻点的秒数差值同样做折线编码"""
+    start_time, offsets = time_offsets(track_times)
+    return {
+        'vehicle_id': vehicle_id,
+        'count': len(offsets),
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'points': encode_polyline(latitudes, longitudes, precision),
+        'times': encode_values(np.diff(offsets, prepend=0).tolist()),
+    }
+
+
+def encode_tracks_binary(tracks):
+    """
+    把多个车辆的轨迹打包为二进制格式。
+
+    :param tracks: [(vehicle_id, latitudes, longitudes, track_times)]。
+    :return: bytes。
+    """
+    parts = [BINARY_MAGIC, struct.pack('<BI', BINARY_VERSION, len(tracks))]
+    for vehicle_id, latitudes, longitudes, track_times in tracks:
+        start_time, offsets = time_offsets(track_times)
+        id_bytes = str(vehicle_id).encode('utf-8')
+        parts.append(struct.pack('<H', len(id_bytes)))
+        parts.append(id_bytes)
+        parts.append(struct.pack('<Iq', len(offsets), int(start_time.timestamp())))
+        parts.append(np.round(np.asarray(latitudes, dtype=float) * BINARY_SCALE).astype('<i4').tobytes())
+        parts.append(np.round(np.asarray(longitudes, dtype=float) * BINARY_SCALE).astype('<i4').tobytes())
+        parts.append(offsets.astype('<u4').tobytes())
+    return b''.join(parts)
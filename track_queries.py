@@ -0,0 +1,167 @@
+# track_queries.py
+
+from datetime import datetime, timedelta, time
+
+
+def day_range(day):
+    """
+    把某一天转换为半开区间 [当天 00:00:00, 次日 00:00:00)。
+    用区间比较代替 DATE(track_time) = %s，MySQL 才能使用 track_time 上的索引。
+
+    :param day: date 或 datetime。
+    :return: (start, end) 两个 datetime。
+    """
+    if isinstance(day, datetime):
+        day = day.date()
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+# 多行 INSERT 每条语句的最大行数
+VALUES_BATCH_SIZE = 500
+
+
+def batched_values(rows, batch_size=VALUES_BATCH_SIZE):
+    """
+    把参数行拼成多行 VALUES 子句，按 batch_size 分批。
+    pymysql 的 executemany 只能把 "VALUES (...) [ON DUPLICATE ...]" 形式的语句合并为一条，
+    带 "AS new" 行别名的 upsert 会退化为逐行执行，这类语句用本函数自行拼接。
+
+    :param rows: [tuple]，每行参数个数相同。
+    :return: 生成 (values, params)：values 为 "(%s, ...), (%s, ...)"，params 为展开后的参数列表。
+    """
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        row_placeholder = f"({', '.join(['%s'] * len(batch[0]))})"
+        yield ', '.join([row_placeholder] * len(batch)), [value for row in batch for value in row]
+
+
+def vehicle_day_tracks(vehicle_id, day):
+    """某车辆（或人员）某天的全部轨迹点，按时间升序"""
+    start, end = day_range(day)
+    query = """
+        SELECT latitude, longitude, track_time
+        FROM VehicleTrack
+        WHERE vehicle_id = %s AND track_time >= %s AND track_time < %s
+        ORDER BY track_time
+    """
+    return query, (vehicle_id, start, end)
+
+
+def vehicles_day_tracks(vehicle_ids, day):
+    """多个车辆（或人员）某天的全部轨迹点，按车辆、时间排序"""
+    start, end = day_range(day)
+    in_placeholders = ','.join(['%s'] * len(vehicle_ids))
+    query = f"""
+        SELECT vehicle_id, latitude, longitude, track_time
+        FROM VehicleTrack
+        WHERE vehicle_id IN ({in_placeholders}) AND track_time >= %s AND track_time < %s
+        ORDER BY vehicle_id, track_time
+    """
+    return query, (*vehicle_ids, start, end)
+
+
+def latest_positions_on_day(vehicle_ids, day):
+    """多个车辆（或人员）在某天的最后位置，读取 vehicle_latest_position"""
+    start, end = day_range(day)
+    in_placeholders = ','.join(['%s'] * len(vehicle_ids))
+    query = f"""
+        SELECT vehicle_id, latitude, longitude, track_time
+        FROM vehicle_latest_position
+        WHERE vehicle_id IN ({in_placeholders}) AND track_time >= %s AND track_time < %s
+    """
+    return query, (*vehicle_ids, start, end)
+
+
+def vehicles_tracked_on_day(day):
+    """某天有轨迹的车辆（或人员）ID；最新位置落在当天即说明当天有轨迹"""
+    start, end = day_range(day)
+    query = """
+        SELECT vehicle_id
+        FROM vehicle_latest_position
+        WHERE track_time >= %s AND track_time < %s
+    """
+    return query, (start, end)
+
+
+def daily_data_on_day(vehicle_ids, day):
+    """多个车辆（或人员）某天的 vehicle_daily_data 统计"""
+    in_placeholders = ','.join(['%s'] * len(vehicle_ids))
+    query = f"""
+        SELECT vehicle_id, running_mileage, driving_duration, parking_duration, engine_off_duration, current_status
+        FROM vehicle_daily_data
+        WHERE vehicle_id IN ({in_placeholders}) AND date = %s
+    """
+    return query, (*vehicle_ids, day)
+
+
+def change_versions(day):
+    """位置表和某天每日数据的最大变化版本号，用于生成增量游标"""
+    query = """
+        SELECT
+            (SELECT COALESCE(MAX(version), 0) FROM vehicle_latest_position),
+            (SELECT COALESCE(MAX(version), 0) FROM vehicle_daily_data WHERE date = %s)
+    """
+    return query, (day,)
+
+
+def changed_entities(day, since):
+    """版本号大于 since 的车辆（或人员）ID：位置前进过或当天统计/状态变化过"""
+    query = """
+        SELECT vehicle_id FROM vehicle_latest_position WHERE version > %s
+        UNION
+        SELECT vehicle_id FROM vehicle_daily_data WHERE date = %s AND version > %s
+    """
+    return query, (since, day, since)
+
+
+def historical_vehicles_page(companies, license_plates, after=None, limit=None):
+    """
+    /api/historical_data 每日数据分页的第一步：按 (车牌, 车辆ID) 键集分页取车辆，
+    使用 vehicleinfo 上的 (license_plate, id) 索引，不需要排序整个结果。
+
+    :param after: 上一页最后一行的 (license_plate, vehicle_info_id)，返回不排在它之前的车辆
+                  （包含该车辆本身，它可能还有没返回的日期）。
+    :return: (query, params)，每行为 (id, license_plate, project_category, driver, driver_phone, vehicle_type, vehicle_name)。
+    """
+    params = [*companies, *license_plates]
+    keyset_condition = ''
+    if after is not None:
+        keyset_condition = "AND (license_plate > %s OR (license_plate = %s AND id >= %s))"
+        params.extend([after[0], after[0], after[1]])
+    limit_clause = ''
+    if limit is not None:
+        limit_clause = 'LIMIT %s'
+        params.append(limit)
+
+    query = f"""
+        SELECT id, license_plate, project_category, driver, driver_phone, vehicle_type, vehicle_name
+        FROM vehicleinfo
+        WHERE project_category IN ({','.join(['%s'] * len(companies))})
+        AND license_plate IN ({','.join(['%s'] * len(license_plates))}) {keyset_condition}
+        ORDER BY license_plate, id
+        {limit_clause}
+    """
+    return query, params
+
+
+def historical_days(vehicle_ids, start_date, end_date):
+    """
+    /api/historical_data 每日数据分页的第二步：若干车辆在区间内的每日数据，按 (vehicle_id, date) 索引顺序读取。
+
+    :return: (query, params)，每行为 (vehicle_id, date, running_mileage, driving_duration, parking_duration, engine_off_duration)。
+    """
+    in_placeholders = ','.join(['%s'] * len(vehicle_ids))
+    query = f"""
+        SELECT
+            vehicle_id,
+            date,
+            COALESCE(running_mileage, 0),
+            COALESCE(driving_duration, 0),
+            COALESCE(parking_duration, 0),
+            COALESCE(engine_off_duration, 0)
+        FROM vehicle_daily_data
+        WHERE vehicle_id IN ({in_placeholders}) AND date BETWEEN %s AND %s
+        ORDER BY vehicle_id, date
+    """
+    return query, (*vehicle_ids, start_date, end_date)
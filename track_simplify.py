@@ -0,0 +1,104 @@
+# track_simplify.py
+
+import math
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import TRACK_CACHE_SIZE, TRACK_CACHE_TODAY_TTL, TRACK_SIMPLIFY_PIXEL_TOLERANCE
+
+# 纬度/经度 1 度对应的近似米数
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LNG = 111320.0
+
+
+def zoom_to_tolerance(zoom, latitude, pixel_tolerance=TRACK_SIMPLIFY_PIXEL_TOLERANCE):
+    """
+    把地图缩放级别换算成简化容差（米）：该级别下 pixel_tolerance 个像素对应的地面距离。
+    Web 墨卡托下每像素米数 = 156543.03392 * cos(纬度) / 2^zoom。
+    """
+    meters_per_pixel = 156543.03392 * math.cos(math.radians(latitude)) / (2 ** zoom)
+    return meters_per_pixel * pixel_tolerance
+
+
+def simplify_track(latitudes, longitudes, tolerance):
+    """
+    Douglas-Peucker 轨迹简化，每一段的点到线段距离用 NumPy 向量化计算。
+
+    :param latitudes: 纬度序列。
+    :param longitudes: 经度序列。
+    :param tolerance: 容差（米），偏离小于该距离的点会被去掉。
+    :return: 保留点的下标数组（升序，始终包含首尾点）。
+    """
+    lat = np.asarray(latitudes, dtype=float)
+    lng = np.asarray(longitudes, dtype=float)
+    n = len(lat)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+
+    # 以轨迹平均纬度做等距投影，把经纬度换算为平面米坐标
+    x = lng * METERS_PER_DEGREE_LNG * math.cos(math.radians(float(lat.mean())))
+    y = lat * METERS_PER_DEGREE_LAT
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        xs = x[start + 1:end] - x[start]
+        ys = y[start + 1:end] - y[start]
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        seg_len = math.hypot(dx, dy)
+        if seg_len == 0:
+            distances = np.hypot(xs, ys)
+        else:
+            distances = np.abs(dy * xs - dx * ys) / seg_len
+
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return np.flatnonzero(keep)
+
+
+class SimplifiedTrackCache:
+    """
+    简化后轨迹的 LRU 缓存，键为 (车辆, 日期, 容差)。
+    历史日期的轨迹不会再变化，一直缓存到被淘汰；当天的轨迹还在增长，只缓存 today_ttl 秒。
+    """
+
+    def __init__(self, maxsize=TRACK_CACHE_SIZE, today_ttl=TRACK_CACHE_TODAY_TTL):
+        self.maxsize = maxsize
+        self.today_ttl = today_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() > expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, is_today):
+        expires_at = time.monotonic() + self.today_ttl if is_today else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+simplified_track_cache = SimplifiedTrackCache()
@@ -0,0 +1,119 @@
+# upstream.py
+
+import time
+import asyncio
+import logging
+import aiohttp
+from config import UPSTREAM_HTTP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTTLCache:
+    """
+    常驻事件循环上使用的进程内 TTL 缓存。
+
+    同一个 key 同时只有一个加载协程在执行（single-flight），其余调用方等待同一个结果；
+    加载出错时不缓存，异常抛给所有等待者。
+    设置 refresh_ahead 时，条目在过期前 refresh_ahead 秒内被读取会在后台提前刷新，调用方仍立即拿到旧值。
+    """
+
+    def __init__(self, ttl, refresh_ahead=0):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._entries = {}   # {key: (过期时间, 值)}
+        self._inflight = {}  # {key: asyncio.Future}
+        self._refreshing = set()  # 正在后台刷新的 key
+        self._background = set()
+
+    async def get_or_load(self, key, loader):
+        """
+        :param loader: 无参数的协程函数，返回要缓存的值。
+        :return: 缓存的值或 loader 的结果。
+        """
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            if self.refresh_ahead and entry[0] - now < self.refresh_ahead and key not in self._refreshing:
+                self._refresh_in_background(key, loader)
+            return entry[1]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        return await self._load(key, loader)
+
+    async def _load(self, key, loader):
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _refresh_in_background(self, key, loader):
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                if key not in self._inflight:
+                    await self._load(key, loader)
+            except Exception as e:
+                # 提前刷新失败时保留旧值，过期后由下一次调用重新加载
+                logger.warning(f"后台刷新缓存 {key} 失败: {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        # 保留任务引用，避免被垃圾回收
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def prune(self):
+        """删除已过期的条目"""
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            self._entries.pop(key, None)
+
+
+_client_session = None
+
+
+def get_client_session():
+    """
+    返回本进程共享的上游 HTTP 客户端（keep-alive 连接池），必须在常驻事件循环上调用。
+    连接会在请求之间复用，不再每个请求新建 TCP 连接。
+    """
+    global _client_session
+    if _client_session is None or _client_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=UPSTREAM_HTTP_CONFIG['limit'],
+            limit_per_host=UPSTREAM_HTTP_CONFIG['limit_per_host'],
+            keepalive_timeout=UPSTREAM_HTTP_CONFIG['keepalive_timeout'],
+        )
+        _client_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=UPSTREAM_HTTP_CONFIG['timeout']),
+        )
+        logger.info("上游 HTTP 客户端已创建。")
+    return _client_session
+
+
+async def close_client_session():
+    """关闭共享的上游 HTTP 客户端（worker 退出时调用）"""
+    global _client_session
+    if _client_session is not None and not _client_session.closed:
+        await _client_session.close()
+    _client_session = None
@@ -8,13 +8,29 @@ import time
 import schedule
 import logging
 from dbutils.pooled_db import PooledDB
-import math
-from config import DB_CONFIG, SESSION_ID_OLD_URBAN, API_URLS, LOG_FILE_TRACKER, SESSION_ID_NEW_URBAN
+import coords
+import track_queries
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import DB_CONFIG, SESSION_ID_OLD_URBAN, API_URLS, LOG_FILE_TRACKER, SESSION_ID_NEW_URBAN, PROVIDER_CONCURRENCY, \
+    TRACK_STORE_CHUNK_SIZE
 from session_manager import SessionManager
+from shared_cache import shared_cache
+from geofence import GeofenceEngine
+from watermarks import WatermarkStore, CheckpointStore, fetch_window
 from datetime import datetime, timedelta
 
 class VehicleTracker:
-    def __init__(self, loop_interval=5):
+    # 新接口每轮最多拉取的页数（每页 pageNum 条）
+    NEW_TRACK_MAX_PAGES = 20
+
+    def __init__(self, loop_interval=5, detect_fences=False):
+        """
+        :param loop_interval: 定时拉取的间隔（分钟）。
+        :param detect_fences: 是否在写入轨迹后检测围栏进出。围栏状态保存在进程内存中，
+                              只能由定时拉取进程（database_updater）开启，避免多个进程重复写入同一事件；
+                              API 进程即时刷新写入的点不检测，其间的进出由定时拉取进程在之后的轨迹点上检测到。
+        """
         self.data_interval = 1
         self.loop_interval = loop_interval  # 循环间隔时间（分钟）
 
@@ -71,45 +87,36 @@ class VehicleTracker:
             maxconnections=5
         )
 
+        # 围栏进出检测在后台线程中进行，不阻塞跟踪循环
+        self.geofence_engine = GeofenceEngine(self.pool) if detect_fences else None
+
+        # 每个上游接口一个有界线程池，并发数互相独立；每个线程复用自己的 requests.Session
+        self.executors = {
+            provider: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'TrackFetch-{provider}')
+            for provider, workers in PROVIDER_CONCURRENCY.items()
+        }
+        self._thread_local = threading.local()
+
+        # 每个车辆（人员）已入库轨迹的最后时间，以及每个接口的拉取断点
+        self.watermarks = WatermarkStore()
+        self.checkpoints = CheckpointStore()
+
     # 判断是否在中国范围内
+    # 坐标转换的实现在 coords 模块中，这里保留原有方法供逐点调用
     def out_of_china(self, lng, lat):
-        if lng < 72.004 or lng > 137.8347:
-            return True
-        if lat < 0.8293 or lat > 55.8271:
-            return True
-        return False
+        return coords.out_of_china(lng, lat)
 
     # 转换纬度
     def transform_lat(self, lng, lat):
-        ret = -100.0 + 2.0 * lng + 3.0 * lat + 0.2 * lat * lat + 0.1 * lng * lat + 0.2 * math.sqrt(abs(lng))
-        ret += (20.0 * math.sin(6.0 * lng * math.pi) + 20.0 * math.sin(2.0 * lng * math.pi)) * 2.0 / 3.0
-        ret += (20.0 * math.sin(lat * math.pi) + 40.0 * math.sin(lat / 3.0 * math.pi)) * 2.0 / 3.0
-        ret += (160.0 * math.sin(lat / 12.0 * math.pi) + 320 * math.sin(lat * math.pi / 30.0)) * 2.0 / 3.0
-        return ret
+        return coords.transform_lat(lng, lat)
 
     # 转换经度
     def transform_lng(self, lng, lat):
-        ret = 300.0 + lng + 2.0 * lat + 0.1 * lng * lng + 0.1 * lng * lat + 0.1 * math.sqrt(abs(lng))
-        ret += (20.0 * math.sin(6.0 * lng * math.pi) + 20.0 * math.sin(2.0 * lng * math.pi)) * 2.0 / 3.0
-        ret += (20.0 * math.sin(lng * math.pi) + 40.0 * math.sin(lng / 3.0 * math.pi)) * 2.0 / 3.0
-        ret += (150.0 * math.sin(lng / 12.0 * math.pi) + 300.0 * math.sin(lng / 30.0 * math.pi)) * 2.0 / 3.0
-        return ret
+        return coords.transform_lng(lng, lat)
 
     # WGS-84 转 GCJ-02
     def wgs84_to_gcj02(self, lng, lat):
-        if self.out_of_china(lng, lat):
-            return lng, lat
-        dlat = self.transform_lat(lng - 105.0, lat - 35.0)
-        dlng = self.transform_lng(lng - 105.0, lat - 35.0)
-        radlat = lat / 180.0 * math.pi
-        magic = math.sin(radlat)
-        magic = 1 - 0.00669342162296594323 * magic * magic
-        sqrtmagic = math.sqrt(magic)
-        dlat = (dlat * 180.0) / ((6335552.717000426 * magic) / (magic * sqrtmagic) * math.pi)
-        dlng = (dlng * 180.0) / (6378137.0 / sqrtmagic * math.cos(radlat) * math.pi)
-        mglat = lat + dlat
-        mglng = lng + dlng
-        return mglng, mglat
+        return coords.wgs84_to_gcj02(lng, lat)
 
     def delete_old_track_data(self):
         """
@@ -132,56 +139,196 @@ class VehicleTracker:
             cursor.close()
             connection.close()
 
-    def get_last_update_time(self, cursor, vehicle_id):
-        cursor.execute("SELECT MAX(track_time) FROM VehicleTrack WHERE vehicle_id = %s", (vehicle_id,))
-        result = cursor.fetchone()
-        return result[0] if result[0] else None
+    def store_latest_positions(self, cursor, optimized_data):
+        """
+        在调用方的事务中将本批轨迹中每个车辆（或人员）的最新点写入 vehicle_latest_position。
+        只有更晚的轨迹点才会覆盖已有位置，迟到或补录的数据不会使位置倒退。
+        """
+        latest = {}
+        for d in optimized_data:
+            current = latest.get(d['vehicle_id'])
+            if current is None or d['track_time'] > current['track_time']:
+                latest[d['vehicle_id']] = d
+
+        if not latest:
+            return
+
+        # 变化版本号（微秒时间戳），供 API 增量查询使用；只有位置前进时才更新
+        version = time.time_ns() // 1000
+
+        # 注意 track_time 必须最后更新，前面的 IF 判断依赖旧的 track_time
+        upsert_query = """
+        INSERT INTO vehicle_latest_position (vehicle_id, latitude, longitude, track_time, version)
+        VALUES {values} AS new
+        ON DUPLICATE KEY UPDATE
+            version = IF(new.track_time > vehicle_latest_position.track_time, new.version, vehicle_latest_position.version),
+            latitude = IF(new.track_time > vehicle_latest_position.track_time, new.latitude, vehicle_latest_position.latitude),
+            longitude = IF(new.track_time > vehicle_latest_position.track_time, new.longitude, vehicle_latest_position.longitude),
+            track_time = GREATEST(vehicle_latest_position.track_time, new.track_time)
+        """
+        # 带行别名的 upsert 不能被 executemany 合并，自行拼成多行语句；出错时由调用方回滚整个事务
+        rows = [(d['vehicle_id'], d['latitude'], d['longitude'], d['track_time'], version) for d in latest.values()]
+        for values, params in track_queries.batched_values(rows):
+            cursor.execute(upsert_query.format(values=values), params)
 
     def log_error_details(self, error_message, data=None):
         logging.error(f"{error_message}")
         if data:
-            logging.error(f"相关数据: {json.dumps(data, ensure_ascii=False)}")
+            logging.error(f"相关数据: {json.dumps(data, ensure_ascii=False, default=str)}")
 
     def fetch_and_store_vehicle_tracks(self):
         connection = self.pool.connection()
         cursor = connection.cursor()
         try:
+            # 一次查询加载全部车辆（人员）的水位线和拉取断点
+            self.watermarks.load_all(cursor)
+            self.checkpoints.load_all(cursor)
+
+            # 先把所有接口的请求提交到各自的线程池，再统一收集结果，
+            # 一轮拉取的耗时取决于最慢的接口，而不是车辆总数
+            futures = []
+
             # 处理老城区环卫车辆（旧接口）
             cursor.execute("SELECT id, carId FROM VehicleInfo WHERE project_category = '老城区环卫' AND carId IS NOT NULL")
             old_vehicles = cursor.fetchall()
-            self.process_old_interface(old_vehicles, cursor)
+            futures += self.submit_old_interface(old_vehicles, cursor)
 
             # 处理老城区环卫车辆（新接口）复用渣土处理函数
             cursor.execute(
                 "SELECT id, license_plate FROM VehicleInfo WHERE project_category = '老城区环卫' AND carId IS NULL")
             old_vehicles = cursor.fetchall()
-            self.process_new_interface(old_vehicles, cursor)
+            futures += self.submit_new_interface(old_vehicles, cursor)
 
             # 处理渣土项目车辆（新接口）
             cursor.execute("SELECT id, license_plate FROM VehicleInfo WHERE project_category = '渣土项目'")
             new_vehicles = cursor.fetchall()
-            self.process_new_interface(new_vehicles, cursor)
+            futures += self.submit_new_interface(new_vehicles, cursor)
 
             # 处理新城区项目车辆（新接口）
             cursor.execute("SELECT id, license_plate FROM VehicleInfo WHERE project_category = '新城区项目'")
             urban_vehicles = cursor.fetchall()
-            self.process_new_urban_project_interface(urban_vehicles, cursor)
+            futures += self.submit_new_urban_project_interface(urban_vehicles, cursor)
 
             # 处理人员轨迹数据（华邺）
             cursor.execute("SELECT PersonnelID, BadgeNumber FROM personnel WHERE Company = '华邺'")
             urban_personnel = cursor.fetchall()
-            self.process_new_urban_project_interface(urban_personnel, cursor)
+            futures += self.submit_new_urban_project_interface(urban_personnel, cursor)
 
-            connection.commit()
+            started = time.perf_counter()
+            optimized_data, checkpoints = self.collect(futures)
+            self.logger.info(f"并发拉取 {len(futures)} 个车辆（人员）的轨迹，耗时 {time.perf_counter() - started:.1f} 秒。")
+
+            self.store_track_data(connection, cursor, optimized_data, checkpoints, '全部接口')
+            shared_cache.invalidate('tracks')
         except Exception as e:
             self.log_error_details(f"获取或插入轨迹数据时出错: {e}")
         finally:
             cursor.close()
             connection.close()
 
-    def process_old_interface(self, vehicles, cursor):
-        optimized_data = []
+    def http(self):
+        """每个线程一个 requests.Session，复用到上游接口的 keep-alive 连接"""
+        session = getattr(self._thread_local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._thread_local.session = session
+        return session
+
+    def fetch_window(self, source, vehicle_id, same_month=False):
+        """
+        本次拉取的时间范围，计算方法见 watermarks.fetch_window。
+
+        :param same_month: 上游不支持跨月查询时，窗口不跨越月份边界。
+        """
+        return fetch_window(self.checkpoints.get(source, vehicle_id), self.watermarks.get(vehicle_id),
+                            datetime.now(), same_month=same_month)
+
+    def thin_points(self, vehicle_id, entries):
+        """
+        按 data_interval 抽稀轨迹点。
+
+        :param entries: [(track_time, latitude, longitude)]，按时间升序。
+        """
+        points = []
+        last_time = None
+        for track_time, latitude, longitude in entries:
+            if last_time is None or (track_time - last_time).total_seconds() >= self.data_interval:
+                points.append({
+                    "vehicle_id": vehicle_id,
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "track_time": track_time
+                })
+                last_time = track_time
+        return points
+
+    def fetch_old_track(self, vehicle_id, params):
+        """:return: (轨迹点列表, None)；旧接口不分页，一次返回全部轨迹"""
+        response = self.http().get(self.old_base_url, params=params)
+        response.raise_for_status()  # 如果响应状态码不是200，将会抛出异常
+        track_data = response.json().get('list', [])
+        return self.thin_points(vehicle_id, (
+            (datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S'), float(entry['glat']), float(entry['glng']))
+            for entry in track_data
+        )), None
+
+    def fetch_new_track(self, vehicle_id, params):
+        """
+        按 curPage 逐页拉取新接口的轨迹，直到某一页不满 pageNum 条。
+        超过 NEW_TRACK_MAX_PAGES 页仍未取完时返回已取到的部分，断点只前移到最后一个点，下一轮接着拉取。
 
+        :return: (轨迹点列表, 截断时间)；取完整个时间范围时截断时间为 None，
+                 否则为上游返回的最后一个点的时间（抽稀之前）。
+        """
+        track_data = []
+        complete = False
+        for page in range(1, self.NEW_TRACK_MAX_PAGES + 1):
+            response = self.http().get(self.new_base_url, params={**params, 'curPage': page})
+            response.raise_for_status()
+            response_data = response.json()
+            if not (response_data['hdr']['code'] == 200 and response_data['data']):
+                complete = True
+                break
+            page_data = response_data['data']['dataList'] or []
+            track_data.extend(page_data)
+            if len(page_data) < params['pageNum']:
+                complete = True
+                break
+
+        if not track_data:
+            return [], None
+        truncated_at = None if complete else datetime.fromtimestamp(max(entry['time'] for entry in track_data))
+
+        # 整批转换坐标，不再逐点调用 wgs84_to_gcj02
+        gcj_lngs, gcj_lats = coords.wgs84_to_gcj02_batch(
+            [entry['longitude'] / 1000000.0 for entry in track_data],
+            [entry['latitude'] / 1000000.0 for entry in track_data]
+        )
+        return self.thin_points(vehicle_id, zip(
+            (datetime.fromtimestamp(entry['time']) for entry in track_data), gcj_lats.tolist(), gcj_lngs.tolist()
+        )), truncated_at
+
+    def fetch_new_urban_project_track(self, vehicle_id, params):
+        """:return: (轨迹点列表, None)；该接口不分页，一次返回全部轨迹"""
+        response = self.http().post(self.new_urban_base_url, json=params)
+        response.raise_for_status()
+        response_data = response.json()
+        if not (response_data['resultCode'] == 0 and response_data['data']):
+            return [], None
+
+        track_data = response_data['data']
+        gcj_lngs, gcj_lats = coords.wgs84_to_gcj02_batch(
+            [float(entry['lon']) for entry in track_data],
+            [float(entry['lat']) for entry in track_data]
+        )
+        return self.thin_points(vehicle_id, zip(
+            (datetime.strptime(entry['gpsTime'], '%Y-%m-%d %H:%M:%S') for entry in track_data),
+            gcj_lats.tolist(), gcj_lngs.tolist()
+        )), None
+
+    def submit_old_interface(self, vehicles, cursor):
+        """把旧接口的请求提交到线程池，返回 [(future, 接口名称, 请求参数, 断点来源, 车辆ID, 拉取结束时间)]"""
+        futures = []
         for vehicle in vehicles:
             vehicle_id, car_id = vehicle
 
@@ -189,72 +336,24 @@ class VehicleTracker:
                 logging.warning(f"车辆 ID {vehicle_id} 的 carId 为空，跳过此车辆。")
                 continue
 
-            last_update_time = self.get_last_update_time(cursor, vehicle_id)
-            if last_update_time and datetime.now() - last_update_time < timedelta(days=2):
-                start_time = last_update_time + timedelta(seconds=1)
-            else:
-                start_time = datetime.now() - timedelta(days=1)
-
-            end_time = datetime.now() + timedelta(seconds=1)
-
-            start_time_str = start_time.strftime('%Y%m%d%H%M%S')
-            end_time_str = end_time.strftime('%Y%m%d%H%M%S')
-
+            start_time, end_time = self.fetch_window('old', vehicle_id)
             params = {
                 "sessionId": self.session_id,
                 "carId": car_id,
-                "startTime": start_time_str,
-                "endTime": end_time_str
+                "startTime": start_time.strftime('%Y%m%d%H%M%S'),
+                "endTime": end_time.strftime('%Y%m%d%H%M%S')
             }
+            future = self.executors['old'].submit(self.fetch_old_track, vehicle_id, params)
+            futures.append((future, '旧接口', params, 'old', vehicle_id, end_time))
+        return futures
 
-            try:
-                response = requests.get(self.old_base_url, params=params)
-                response.raise_for_status()  # 如果响应状态码不是200，将会抛出异常
-                track_data = response.json().get('list', [])
-                last_time = None
-                for entry in track_data:
-                    track_time = datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S')
-                    if last_time is None or (track_time - last_time).total_seconds() >= self.data_interval:
-                        optimized_data.append({
-                            "vehicle_id": vehicle_id,
-                            "latitude": float(entry['glat']),
-                            "longitude": float(entry['glng']),
-                            "track_time": track_time
-                        })
-                        last_time = track_time
-            except requests.RequestException as req_e:
-                self.log_error_details(f"旧接口请求出错: {req_e}", data=params)
-            except Exception as e:
-                self.log_error_details(f"处理旧接口数据时出错: {e}", data=params)
-
-        if optimized_data:
-            try:
-                insert_query = """
-                INSERT INTO VehicleTrack (vehicle_id, latitude, longitude, track_time)
-                VALUES (%s, %s, %s, %s)
-                """
-                data_to_insert = [(d['vehicle_id'], d['latitude'], d['longitude'], d['track_time']) for d in optimized_data]
-                cursor.executemany(insert_query, data_to_insert)
-                logging.info(f"{len(data_to_insert)} 条记录插入成功.")
-            except Exception as e:
-                self.log_error_details(f"插入旧接口轨迹数据时出错: {e}", data=optimized_data)
-        else:
-            logging.info("没有新的轨迹数据插入（旧接口）。")
-
-    def process_new_interface(self, vehicles, cursor):
-        optimized_data = []
-
+    def submit_new_interface(self, vehicles, cursor):
+        """把新接口的请求提交到线程池，返回值同 submit_old_interface"""
+        futures = []
         for vehicle in vehicles:
             vehicle_id, license_plate = vehicle
 
-            last_update_time = self.get_last_update_time(cursor, vehicle_id)
-            if last_update_time and datetime.now() - last_update_time < timedelta(days=2):
-                start_time = last_update_time + timedelta(seconds=1)
-            else:
-                start_time = datetime.now() - timedelta(days=1)
-
-            end_time = datetime.now() + timedelta(seconds=1)
-
+            start_time, end_time = self.fetch_window('new', vehicle_id)
             params = {
                 "startTime": start_time.strftime('%Y-%m-%d %H:%M:%S'),
                 "endTime": end_time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -262,110 +361,167 @@ class VehicleTracker:
                 "curPage": 1,
                 "pageNum": 9999
             }
-
-            try:
-                response = requests.get(self.new_base_url, params=params)
-                response.raise_for_status()
-                response_data = response.json()
-                if response_data['hdr']['code'] == 200 and response_data['data']:
-                    track_data = response_data['data']['dataList']
-                    last_time = None
-                    for entry in track_data:
-                        wgs_lng = entry['longitude'] / 1000000.0
-                        wgs_lat = entry['latitude'] / 1000000.0
-
-                        gcj_lng, gcj_lat = self.wgs84_to_gcj02(wgs_lng, wgs_lat)
-
-                        track_time = datetime.fromtimestamp(entry['time'])
-                        if last_time is None or (track_time - last_time).total_seconds() >= self.data_interval:
-                            optimized_data.append({
-                                "vehicle_id": vehicle_id,
-                                "latitude": gcj_lat,
-                                "longitude": gcj_lng,
-                                "track_time": track_time
-                            })
-                            last_time = track_time
-
-            except requests.RequestException as req_e:
-                self.log_error_details(f"新接口请求出错: {req_e}", data=params)
-            except Exception as e:
-                self.log_error_details(f"处理新接口数据时出错: {e}", data=params)
-
-        if optimized_data:
-            try:
-                insert_query = """
-                INSERT INTO VehicleTrack (vehicle_id, latitude, longitude, track_time)
-                VALUES (%s, %s, %s, %s)
-                """
-                data_to_insert = [(d['vehicle_id'], d['latitude'], d['longitude'], d['track_time']) for d in optimized_data]
-                cursor.executemany(insert_query, data_to_insert)
-                logging.info(f"{len(data_to_insert)} 条记录插入成功（新接口）。")
-            except Exception as e:
-                self.log_error_details(f"插入新接口轨迹数据时出错: {e}", data=optimized_data)
-        else:
-            logging.info("没有新的轨迹数据插入（新接口）。")
-
-    def process_new_urban_project_interface(self, vehicles, cursor):
-        optimized_data = []
-
+            future = self.executors['new'].submit(self.fetch_new_track, vehicle_id, params)
+            futures.append((future, '新接口', params, 'new', vehicle_id, end_time))
+        return futures
+
+    def submit_new_urban_project_interface(self, vehicles, cursor):
+        """把新城区项目接口的请求提交到线程池，返回值同 submit_old_interface"""
+        futures = []
+        if not vehicles:
+            return futures
+        session_id = self.session_manager.get_session_id()
         for vehicle in vehicles:
             vehicle_id, license_plate = vehicle
 
-            last_update_time = self.get_last_update_time(cursor, vehicle_id)
-            if last_update_time and datetime.now() - last_update_time < timedelta(days=2):
-                start_time = last_update_time + timedelta(seconds=1)
-            else:
-                start_time = datetime.now() - timedelta(days=1)
-
-            end_time = datetime.now() + timedelta(seconds=1)
-
-            # 如果开始时间和结束时间不在同一个月内，调整开始时间为结束时间所在月的月初
-            if start_time.month != end_time.month:
-                start_time = datetime(end_time.year, end_time.month, 1, 0, 0, 0)
+            # 新城区项目接口不支持跨月查询
+            start_time, end_time = self.fetch_window('new_urban_project', vehicle_id, same_month=True)
 
             params = {
                 "beginTime": start_time.strftime('%Y-%m-%d %H:%M:%S'),
                 "endTime": end_time.strftime('%Y-%m-%d %H:%M:%S'),
                 "vehicleNum": license_plate,
-                "sessionId": self.session_manager.get_session_id()
+                "sessionId": session_id
             }
+            future = self.executors['new_urban_project'].submit(self.fetch_new_urban_project_track, vehicle_id, params)
+            futures.append((future, '新城区项目接口', params, 'new_urban_project', vehicle_id, end_time))
+        return futures
+
+    def collect(self, futures):
+        """
+        等待所有请求完成并合并轨迹点；单个车辆请求失败只记录日志，不影响其他车辆，其断点也不前移。
 
+        :return: (轨迹点列表, 断点列表 [(source, entity_id, fetched_until, last_point_time)])。
+        """
+        optimized_data = []
+        checkpoints = []
+        for future, provider, params, source, vehicle_id, end_time in futures:
             try:
-                response = requests.post(self.new_urban_base_url, json=params)
-                response.raise_for_status()
-                response_data = response.json()
-                if response_data['resultCode'] == 0 and response_data['data']:
-                    track_data = response_data['data']
-                    last_time = None
-                    for entry in track_data:
-                        track_time = datetime.strptime(entry['gpsTime'], '%Y-%m-%d %H:%M:%S')
-                        if last_time is None or (track_time - last_time).total_seconds() >= self.data_interval:
-                            gcj_lng, gcj_lat = self.wgs84_to_gcj02(float(entry['lon']), float(entry['lat']))
-                            optimized_data.append({
-                                "vehicle_id": vehicle_id,
-                                "latitude": gcj_lat,
-                                "longitude": gcj_lng,
-                                "track_time": track_time
-                            })
-                            last_time = track_time
+                points, truncated_at = future.result()
             except requests.RequestException as req_e:
-                self.log_error_details(f"新城区项目接口请求出错: {req_e}", data=params)
+                self.log_error_details(f"{provider}请求出错: {req_e}", data=params)
+                continue
             except Exception as e:
-                self.log_error_details(f"处理新城区项目数据时出错: {e}", data=params)
+                self.log_error_details(f"处理{provider}数据时出错: {e}", data=params)
+                continue
+            optimized_data.extend(points)
+            last_point_time = max((d['track_time'] for d in points), default=None)
+            if truncated_at is not None:
+                # 上游结果被截断：断点只前移到上游返回的最后一个点，剩下的部分下一轮再拉取
+                self.logger.warning(f"{provider}返回的轨迹不完整，车辆（人员）{vehicle_id} 只拉取到 {truncated_at}。")
+                end_time = min(end_time, truncated_at)
+            checkpoints.append((source, vehicle_id, end_time, last_point_time))
+        return optimized_data, checkpoints
+
+    def dedupe_points(self, optimized_data):
+        """去掉同一车辆（人员）同一时间的重复轨迹点，保留先出现的一条"""
+        seen = set()
+        unique = []
+        for d in optimized_data:
+            key = (d['vehicle_id'], d['track_time'])
+            if key not in seen:
+                seen.add(key)
+                unique.append(d)
+        return unique
+
+    def store_track_data(self, connection, cursor, optimized_data, checkpoints, provider):
+        """
+        写入轨迹点、最新位置和拉取断点。按车辆（人员）分块，每块 TRACK_STORE_CHUNK_SIZE 个一个事务；
+        某一块写入失败时整块回滚，再逐个车辆重试，出错的车辆断点保持不变，下一轮从原位置重新拉取，
+        其他车辆照常入库。
 
-        if optimized_data:
+        :return: 写入失败的车辆（人员）ID 列表。
+        """
+        optimized_data = self.dedupe_points(optimized_data)
+        if not optimized_data and not checkpoints:
+            logging.info(f"没有新的轨迹数据插入（{provider}）。")
+            return []
+
+        points_by_entity = {}
+        for d in optimized_data:
+            points_by_entity.setdefault(d['vehicle_id'], []).append(d)
+        checkpoints_by_entity = {}
+        for checkpoint in checkpoints:
+            checkpoints_by_entity.setdefault(checkpoint[1], []).append(checkpoint)
+        entities = list(dict.fromkeys([*points_by_entity, *checkpoints_by_entity]))
+
+        inserted = 0
+        failed = []
+        for i in range(0, len(entities), TRACK_STORE_CHUNK_SIZE):
+            chunk = entities[i:i + TRACK_STORE_CHUNK_SIZE]
             try:
+                inserted += self.store_chunk(connection, cursor, chunk, points_by_entity, checkpoints_by_entity)
+                continue
+            except Exception as e:
+                logging.warning(f"批量写入{provider}轨迹数据时出错，逐个车辆重试: {e}")
+            for entity_id in chunk:
+                try:
+                    inserted += self.store_chunk(connection, cursor, [entity_id], points_by_entity, checkpoints_by_entity)
+                except Exception as e:
+                    failed.append(entity_id)
+                    self.log_error_details(f"写入{provider}车辆（人员）{entity_id} 的轨迹数据时出错: {e}",
+                                           data=points_by_entity.get(entity_id))
+
+        stored = sum(len(points_by_entity.get(entity_id, ())) for entity_id in entities if entity_id not in failed)
+        logging.info(f"{inserted} 条记录插入成功，{stored - inserted} 条已存在（{provider}），"
+                     f"{len(entities) - len(failed)} 个车辆（人员）写入成功，{len(failed)} 个失败。")
+        return failed
+
+    def store_chunk(self, connection, cursor, entity_ids, points_by_entity, checkpoints_by_entity):
+        """
+        在一个事务中写入一组车辆（人员）的轨迹点、最新位置和拉取断点；
+        提交成功后再前移内存中的水位线和断点、提交围栏检测，失败时回滚并抛出异常。
+
+        :return: 实际插入的轨迹点数（不含已存在的点）。
+        """
+        points = [d for entity_id in entity_ids for d in points_by_entity.get(entity_id, ())]
+        checkpoints = [c for entity_id in entity_ids for c in checkpoints_by_entity.get(entity_id, ())]
+
+        inserted = 0
+        try:
+            connection.begin()
+            if points:
+                # (vehicle_id, track_time) 有唯一键：重叠窗口、即时刷新等重复拉取到的点直接忽略
                 insert_query = """
                 INSERT INTO VehicleTrack (vehicle_id, latitude, longitude, track_time)
                 VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE vehicle_id = vehicle_id
                 """
-                data_to_insert = [(d['vehicle_id'], d['latitude'], d['longitude'], d['track_time']) for d in optimized_data]
-                cursor.executemany(insert_query, data_to_insert)
-                logging.info(f"{len(data_to_insert)} 条记录插入成功（新城区项目接口）。")
-            except Exception as e:
-                self.log_error_details(f"插入新城区项目轨迹数据时出错: {e}", data=optimized_data)
-        else:
-            logging.info("没有新的轨迹数据插入（新城区项目接口）。")
+                data_to_insert = [(d['vehicle_id'], d['latitude'], d['longitude'], d['track_time']) for d in points]
+                inserted = cursor.executemany(insert_query, data_to_insert) or 0
+                self.store_latest_positions(cursor, points)
+            self.checkpoints.save(cursor, checkpoints)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+        self.watermarks.advance(points)
+        self.checkpoints.advance(checkpoints)
+        if points and self.geofence_engine is not None:
+            self.geofence_engine.submit(points)
+        return inserted
+
+    def collect_and_store(self, futures, connection, cursor, provider):
+        """
+        收集请求结果并写入数据库。
+
+        :return: 所有请求都成功且所有车辆（人员）都写入成功时返回 True。
+        """
+        optimized_data, checkpoints = self.collect(futures)
+        failed = self.store_track_data(connection, cursor, optimized_data, checkpoints, provider)
+        # 请求出错的车辆（人员）没有断点
+        return len(checkpoints) == len(futures) and not failed
+
+    def process_old_interface(self, vehicles, connection, cursor):
+        return self.collect_and_store(self.submit_old_interface(vehicles, cursor), connection, cursor, '旧接口')
+
+    def process_new_interface(self, vehicles, connection, cursor):
+        return self.collect_and_store(self.submit_new_interface(vehicles, cursor), connection, cursor, '新接口')
+
+    def process_new_urban_project_interface(self, vehicles, connection, cursor):
+        return self.collect_and_store(self.submit_new_urban_project_interface(vehicles, cursor), connection, cursor,
+                                      '新城区项目接口')
 
     def start(self):
         # 立即运行一次
@@ -389,6 +545,7 @@ class VehicleTracker:
         根据单一车牌号查询车辆轨迹并更新数据库。
 
         :param license_plate: 车辆的车牌号。
+        :return: 轨迹拉取并写入成功时返回 True；找不到车辆、上游请求或写入出错时返回 False。
         """
         connection = self.pool.connection()
         cursor = connection.cursor()
@@ -407,36 +564,50 @@ class VehicleTracker:
             vehicle = cursor.fetchone()
             if not vehicle:
                 self.logger.warning(f"没有找到车牌号为 {license_plate} 的车辆信息。")
-                return
+                return False
+
+            # 人员查询只有三列，不能按车辆的四列解包
+            if person:
+                Company, PersonnelID, BadgeNumber = vehicle
+                vehicle_id = PersonnelID
+            else:
+                vehicle_id, project_category, car_id, license_plate = vehicle
 
-            vehicle_id, project_category, car_id, license_plate = vehicle
+            # 重新加载该车辆（人员）的水位线和拉取断点，与定时拉取使用同一份数据
+            self.watermarks.load(cursor, [vehicle_id])
+            self.checkpoints.load(cursor, [vehicle_id])
 
             # 根据项目类别选择处理函数
             if person:
-                Company, PersonnelID, BadgeNumber = vehicle
                 urban_personnel = [(PersonnelID, BadgeNumber)]
-                self.process_new_urban_project_interface(urban_personnel, cursor)
+                success = self.process_new_urban_project_interface(urban_personnel, connection, cursor)
 
             elif project_category == '老城区环卫':
                 if car_id:
                     vehicles = [(vehicle_id, car_id)]
-                    self.process_old_interface(vehicles, cursor)
+                    success = self.process_old_interface(vehicles, connection, cursor)
                 else:
                     vehicles = [(vehicle_id, license_plate)]
-                    self.process_new_interface(vehicles, cursor)
+                    success = self.process_new_interface(vehicles, connection, cursor)
             elif project_category == '渣土项目':
                 vehicles = [(vehicle_id, license_plate)]
-                self.process_new_interface(vehicles, cursor)
+                success = self.process_new_interface(vehicles, connection, cursor)
             elif project_category == '新城区项目':
                 vehicles = [(vehicle_id, license_plate)]
-                self.process_new_urban_project_interface(vehicles, cursor)
+                success = self.process_new_urban_project_interface(vehicles, connection, cursor)
             else:
                 self.logger.warning(f"未知的项目类别 {project_category}，无法处理车辆 ID {vehicle_id}。")
+                return False
 
-            connection.commit()
+            shared_cache.invalidate('tracks')
+            if not success:
+                self.logger.warning(f"车牌号 {license_plate} 的轨迹数据拉取或写入失败。")
+                return False
             self.logger.info(f"成功处理车牌号 {license_plate} 的轨迹数据。")
+            return True
         except Exception as e:
             self.log_error_details(f"根据车牌号 {license_plate} 获取或插入轨迹数据时出错: {e}")
+            return False
         finally:
             cursor.close()
             connection.close()
\ No newline at end of file
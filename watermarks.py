@@ -0,0 +1,171 @@
+# watermarks.py
+
+import threading
+import track_queries
+from datetime import datetime, timedelta
+from config import INGEST_CHECKPOINT_CONFIG
+
+
+def next_month_start(moment):
+    """moment 所在月的下一个月的 1 日 00:00:00"""
+    return (datetime(moment.year, moment.month, 1) + timedelta(days=32)).replace(day=1)
+
+
+def fetch_window(checkpoint, watermark, now, same_month=False, config=INGEST_CHECKPOINT_CONFIG):
+    """
+    计算一个车辆（人员）本次向上游拉取的时间范围。
+
+    有断点时从 max(最后入库点 + 1 秒, 已拉取到的时间 - grace) 开始；没有断点时按最后入库的轨迹时间续拉，
+    都没有时取最近 initial_hours 小时。每次最多拉取 chunk_hours 小时，长时间中断后每轮补齐一段。
+
+    :param checkpoint: CheckpointStore.get() 的返回值 (fetched_until, last_point_time) 或 None。
+    :param watermark: WatermarkStore.get() 的返回值或 None。
+    :param same_month: 上游不支持跨月查询时，结束时间截断在开始时间所在月的月末；
+                       已拉取到月末时从下月 1 日开始，grace 不会把开始时间退回上个月。
+    :return: (start_time, end_time)。
+    """
+    if checkpoint:
+        fetched_until, last_point_time = checkpoint
+        start_time = fetched_until - timedelta(seconds=config['grace'])
+        if same_month:
+            # fetched_until 为月末 23:59:59 时，下一秒所在月的 1 日就是下月 1 日
+            resume_at = fetched_until + timedelta(seconds=1)
+            start_time = max(start_time, datetime(resume_at.year, resume_at.month, 1))
+        if last_point_time:
+            start_time = max(start_time, last_point_time + timedelta(seconds=1))
+    elif watermark:
+        start_time = watermark + timedelta(seconds=1)
+    else:
+        start_time = now - timedelta(hours=config['initial_hours'])
+
+    start_time = max(start_time, now - timedelta(days=config['max_backfill_days']))
+    end_time = min(now + timedelta(seconds=1), start_time + timedelta(hours=config['chunk_hours']))
+
+    # 开始时间和结束时间不在同一个月内时，结束时间截断到开始时间所在月的月末，下一轮再从下月 1 日继续
+    if same_month and end_time >= next_month_start(start_time):
+        end_time = next_month_start(start_time) - timedelta(seconds=1)
+    return start_time, end_time
+
+
+class WatermarkStore:
+    """
+    每个车辆（或人员）已入库轨迹的最后时间（水位线），决定下一次向上游拉取的起始时间。
+
+    定时拉取开始时用一条查询从 vehicle_latest_position 加载全部水位线，写入成功后在内存中前移，
+    不再每个车辆查询一次 MAX(track_time)。按车牌的即时刷新只重新加载该车辆的水位线，
+    两条路径读写同一份数据，起始时间保持一致。
+    """
+
+    def __init__(self):
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def load_all(self, cursor):
+        """从最新位置表加载全部水位线（每轮拉取一次）"""
+        cursor.execute("SELECT vehicle_id, track_time FROM vehicle_latest_position")
+        marks = {vehicle_id: track_time for vehicle_id, track_time in cursor.fetchall()}
+        with self._lock:
+            self._marks = marks
+
+    def load(self, cursor, vehicle_ids):
+        """重新加载指定车辆的水位线（其他进程可能已经写入了更新的轨迹）"""
+        if not vehicle_ids:
+            return
+        placeholders = ','.join(['%s'] * len(vehicle_ids))
+        cursor.execute(
+            f"SELECT vehicle_id, track_time FROM vehicle_latest_position WHERE vehicle_id IN ({placeholders})",
+            tuple(vehicle_ids)
+        )
+        rows = cursor.fetchall()
+        with self._lock:
+            for vehicle_id in vehicle_ids:
+                self._marks.pop(vehicle_id, None)
+            self._marks.update({vehicle_id: track_time for vehicle_id, track_time in rows})
+
+    def get(self, vehicle_id):
+        """:return: 最后入库的轨迹时间，没有记录时返回 None"""
+        with self._lock:
+            return self._marks.get(vehicle_id)
+
+    def advance(self, points):
+        """
+        轨迹写入成功后前移水位线，只会向后移动。
+
+        :param points: [{'vehicle_id', 'track_time', ...}]。
+        """
+        with self._lock:
+            for d in points:
+                current = self._marks.get(d['vehicle_id'])
+                if current is None or d['track_time'] > current:
+                    self._marks[d['vehicle_id']] = d['track_time']
+
+
+class CheckpointStore:
+    """
+    ingest_checkpoints 表的内存副本：每个 (接口, 车辆) 已拉取到的时间（fetched_until）和最后一个已提交的轨迹点时间。
+
+    断点与轨迹在同一事务中写入（save()），事务提交后再调用 advance() 更新内存，
+    因此重启后可以从断点准确续拉，写入失败时断点也不会前移。
+    """
+
+    UPSERT_QUERY = """
+        INSERT INTO ingest_checkpoints (source, entity_id, fetched_until, last_point_time)
+        VALUES {values} AS new
+        ON DUPLICATE KEY UPDATE
+            fetched_until = GREATEST(ingest_checkpoints.fetched_until, new.fetched_until),
+            last_point_time = COALESCE(GREATEST(ingest_checkpoints.last_point_time, new.last_point_time),
+                                       ingest_checkpoints.last_point_time, new.last_point_time)
+    """
+
+    def __init__(self):
+        self._checkpoints = {}
+        self._lock = threading.Lock()
+
+    def load_all(self, cursor):
+        cursor.execute("SELECT source, entity_id, fetched_until, last_point_time FROM ingest_checkpoints")
+        checkpoints = {(source, entity_id): (fetched_until, last_point_time)
+                       for source, entity_id, fetched_until, last_point_time in cursor.fetchall()}
+        with self._lock:
+            self._checkpoints = checkpoints
+
+    def load(self, cursor, entity_ids):
+        """重新加载指定车辆（人员）在所有接口上的断点"""
+        if not entity_ids:
+            return
+        placeholders = ','.join(['%s'] * len(entity_ids))
+        cursor.execute(
+            f"SELECT source, entity_id, fetched_until, last_point_time FROM ingest_checkpoints "
+            f"WHERE entity_id IN ({placeholders})",
+            tuple(entity_ids)
+        )
+        rows = cursor.fetchall()
+        with self._lock:
+            for key in [key for key in self._checkpoints if key[1] in entity_ids]:
+                del self._checkpoints[key]
+            for source, entity_id, fetched_until, last_point_time in rows:
+                self._checkpoints[(source, entity_id)] = (fetched_until, last_point_time)
+
+    def get(self, source, entity_id):
+        """:return: (fetched_until, last_point_time)，没有断点时返回 None"""
+        with self._lock:
+            return self._checkpoints.get((source, entity_id))
+
+    def save(self, cursor, checkpoints):
+        """
+        在调用方的事务中写入断点，多行 upsert 每批一条语句。
+
+        :param checkpoints: [(source, entity_id, fetched_until, last_point_time)]。
+        """
+        for values, params in track_queries.batched_values(checkpoints):
+            cursor.execute(self.UPSERT_QUERY.format(values=values), params)
+
+    def advance(self, checkpoints):
+        """事务提交后更新内存中的断点，只会向后移动"""
+        with self._lock:
+            for source, entity_id, fetched_until, last_point_time in checkpoints:
+                current = self._checkpoints.get((source, entity_id))
+                if current is not None:
+                    fetched_until = max(fetched_until, current[0]) if current[0] else fetched_until
+                    if current[1] is not None:
+                        last_point_time = max(last_point_time, current[1]) if last_point_time else current[1]
+                self._checkpoints[(source, entity_id)] = (fetched_until, last_point_time)
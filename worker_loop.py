@@ -0,0 +1,56 @@
+# worker_loop.py
+
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+
+# 每个 worker 进程只有一个常驻事件循环：Flask 的 async 视图、数据库连接池、上游 HTTP 客户端都运行在它上面
+_loop = None
+_lock = threading.Lock()
+
+
+def use_loop(loop):
+    """使用已在运行的事件循环（例如 ASGI 服务器的事件循环）作为本进程的常驻事件循环"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = loop
+    return _loop
+
+
+def get_loop():
+    """返回本进程的常驻事件循环，没有时在后台线程中启动一个"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='WorkerLoop', daemon=True)
+            thread.start()
+            _loop = loop
+    return _loop
+
+
+def run(coro):
+    """
+    在常驻事件循环中执行协程并阻塞等待结果，供同步代码（如 WSGI 线程）调用。
+    调用方的 contextvars（包括 Flask 的请求上下文）会复制给该协程。
+    """
+    loop = get_loop()
+    context = contextvars.copy_context()
+    future = concurrent.futures.Future()
+
+    def copy_result(task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        task = context.run(loop.create_task, coro)
+        task.add_done_callback(copy_result)
+
+    loop.call_soon_threadsafe(start)
+    return future.result()